@@ -4,17 +4,17 @@ import math
 
 import yaml
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import stats
-import PySimpleGUI as sg
 import pca9685_psd
-
-pca = pca9685_psd.PCA9685()
+from pca9685_psd.servo import CAL_FITS, CalibrationLUT, fit_usec
 
 log = logging.getLogger(__name__)
 
+# The PCA9685 is opened the first time a servo is moved, see get_pca()
+pca = None
+
 # This is the dictionary that is written as a YAML file.
 servo_cal = dict()
+cal_path = 'servo_cal.yaml'     # the first command line argument, if given
 current_channel = 0
 units = {
     '-RAD-': {'sgtext': 'Radians'},
@@ -38,6 +38,16 @@ default270_points = (
 default_cal = default270_points
 
 
+def get_pca() -> pca9685_psd.PCA9685:
+    """The PCA9685, opened and initialized on first use."""
+
+    global pca
+    if pca is None:
+        pca = pca9685_psd.PCA9685(bus_frequency=servo_cal.get('pwm frequency', 60.0),
+                                  clock_correction=servo_cal.get('clock correction', 0.920))
+    return pca
+
+
 def points_are_close(p1: tuple[float, float], p2: tuple[float, float],
                      tol_usec: float = 0.01, tol_rad: float = 0.001) -> bool:
 
@@ -123,6 +133,8 @@ def init_cal_data() -> None:
     default_channel = {
         'active': True,
         'valid fit': False,
+        'fit': 'linear',
+        'degree': 3,
         'name': '',
         'usec lower limit': 1000.0,
         'usec upper limit': 2000.0,
@@ -132,6 +144,10 @@ def init_cal_data() -> None:
         'points': []
         }
 
+    # Settings for the whole board, next to the channel numbers
+    servo_cal['pwm frequency']    = 60.0
+    servo_cal['clock correction'] = 0.920
+
     for ch_indx in range(16):
         default_channel['name']   = 'servo'+str(ch_indx)
         default_channel['points'] = list(default_cal)
@@ -148,9 +164,18 @@ def points_current(points: list) -> list:
 
 
 def fit_cal_funtion(chan_num: int) -> None:
+    """Fit the channel's points with its fit, 'linear', 'poly' or 'piecewise'.
+
+    slope and intercept always hold the straight line fit.  A poly fit also
+    stores its coefficients, highest power first.  A piecewise fit uses the
+    points themselves.
+    """
     global servo_cal
 
+    from scipy import stats     # slow to import, only needed here
+
     pnts = np.array(servo_cal[chan_num]['points'])
+    fit = servo_cal[chan_num].get('fit', 'linear')
 
     if len(pnts) >= 2:
         x = pnts[:, 1]  # Angles
@@ -161,6 +186,15 @@ def fit_cal_funtion(chan_num: int) -> None:
         servo_cal[chan_num]['slope']     = float(res.slope)
         servo_cal[chan_num]['rvalue']    = float(res.rvalue)
         servo_cal[chan_num]['valid fit'] = True
+
+        if fit == 'poly':
+            # A degree n polynomial needs at least n+1 points
+            degree = min(int(servo_cal[chan_num].get('degree', 3)), len(pnts) - 1)
+            coefficients = np.polyfit(x, y, degree)
+            servo_cal[chan_num]['coefficients'] = [float(c) for c in coefficients]
+            servo_cal[chan_num]['rvalue'] = float(np.corrcoef(np.polyval(coefficients, x), y)[0, 1])
+        elif fit == 'piecewise':
+            servo_cal[chan_num]['rvalue'] = 1.0
     else:
         servo_cal[chan_num]['active']    = False
         servo_cal[chan_num]['valid fit'] = False
@@ -168,12 +202,14 @@ def fit_cal_funtion(chan_num: int) -> None:
 def usec_to_radian(chan_num: int, usec: float) -> float:
     global servo_cal
 
-    if servo_cal[chan_num]['valid fit']:
+    if not servo_cal[chan_num]['valid fit']:
+        rad = math.nan
+    elif servo_cal[chan_num].get('fit', 'linear') != 'linear':
+        rad = CalibrationLUT.from_fits([servo_cal[chan_num]]).inverse(0, usec)
+    else:
         slope = servo_cal[chan_num]['slope']
         inter = servo_cal[chan_num]['intercept']
         rad = (usec - inter) / slope
-    else:
-        rad = math.nan
 
     return rad
 
@@ -188,6 +224,10 @@ def run_gui() -> None:
     global units
     global current_units
 
+    # The GUI and plotting packages are slow to import, only the GUI needs them
+    import matplotlib.pyplot as plt
+    import PySimpleGUI as sg
+
     init_cal_data()
 
     num_input_sz = 20
@@ -336,7 +376,11 @@ def run_gui() -> None:
                     size=(30,4),
                     key='MULTI')],
 
-        [sg.Button('Plot', key='FIT'),
+        [sg.Text('Fit'),
+         sg.Combo(CAL_FITS, default_value='linear', key='-FIT_KIND-', readonly=True,
+                  enable_events=True,
+                  tooltip='poly fits a cubic, piecewise joins the points with straight lines.'),
+         sg.Button('Plot', key='FIT'),
          sg.Push(),
          sg.Button('Save', key='SAVE'),
          sg.Button('Quit', key='QUIT')
@@ -364,6 +408,7 @@ def run_gui() -> None:
         window['CHAN_NAME'].update(servo_cal[current_channel]['name'])
         window['CHAN_ENABLED'].update(servo_cal[current_channel]['active'],
                                       text_color='black')
+        window['-FIT_KIND-'].update(servo_cal[current_channel].get('fit', 'linear'))
         unit_txt = units[current_units]['sgtext']
         window['LIMIT_ANGLE_UNITS'].update(unit_txt)
         window['LOWER_LIMIT'].update(str(servo_cal[current_channel]['usec lower limit']))
@@ -385,7 +430,7 @@ def run_gui() -> None:
             break
 
         elif event == '-LOADCAL-':
-            with open('servo_cal.yaml', mode="rt", encoding="utf-8") as cfile:
+            with open(cal_path, mode="rt", encoding="utf-8") as cfile:
                 servo_cal = yaml.safe_load(cfile)
 
             update_window(window)
@@ -406,6 +451,7 @@ def run_gui() -> None:
             window['LOWER_LIMIT'].update(str(servo_cal[current_channel]['usec lower limit']))
             window['UPPER_LIMIT'].update(str(servo_cal[current_channel]['usec upper limit']))
             window['CHAN_NAME'].update(servo_cal[current_channel]['name'])
+            window['-FIT_KIND-'].update(servo_cal[current_channel].get('fit', 'linear'))
 
             ch_active = servo_cal[current_channel]['active']
             window['EDIT_SECTION'].update(visible=ch_active)
@@ -429,6 +475,10 @@ def run_gui() -> None:
                 window['CHAN_ENABLED'].update(servo_cal[current_channel]['active'],
                                               text_color='red')
 
+        elif event == '-FIT_KIND-':
+            servo_cal[current_channel]['fit'] = values['-FIT_KIND-']
+            update_limit_angles(window)
+
         elif event == 'CHAN_NAME':
             servo_cal[current_channel]['name'] = values['CHAN_NAME']
 
@@ -509,7 +559,7 @@ def run_gui() -> None:
         elif event == '-MOVE-':
             try:
                 usec_val  = float(values['USEC'])
-                pca.goto_usec(current_channel, usec_val)
+                get_pca().goto_usec(current_channel, usec_val)
             except (ValueError, TypeError):
                 sg.popup   ('Microseconds should be a number', title='ERROR')
                 continue
@@ -550,18 +600,19 @@ def run_gui() -> None:
                 upper_limit_val = servo_cal[current_channel]['usec upper limit']
 
 
+                fit_cal_funtion(current_channel)
+                channel = servo_cal[current_channel]
+
                 x = pnts[:,1]   # Angles
-                x = x * from_rad(1.0)
                 y = pnts[:,0]   # Pulse Width in microseconds
-                res = stats.linregress(x, y)
-
-                servo_cal[current_channel]['intercept'] = float(res.intercept)
-                servo_cal[current_channel]['slope']     = float(res.slope)
-                servo_cal[current_channel]['rvalue']    = float(res.rvalue)
+                x_fit = np.linspace(min(x), max(x), 200)
+                y_fit = fit_usec(channel, x_fit)
+                x = x * from_rad(1.0)
+                x_fit = x_fit * from_rad(1.0)
 
                 plt.clf()
                 plt.plot(x, y, 'o', label='calibration points')
-                plt.plot(x, res.intercept + res.slope * x, 'r', label='fitted line')
+                plt.plot(x_fit, y_fit, 'r', label='fitted ' + channel.get('fit', 'linear'))
                 plt.hlines(lower_limit_val,
                            xmin=min(x),
                            xmax=max(x),
@@ -578,18 +629,21 @@ def run_gui() -> None:
                 plt.xlabel(units[current_units]['sgtext'])
                 plt.ylabel('microseconds')
 
+                # slope and intercept are the straight line fit, per radian
+                slope, intercept, rvalue = channel['slope'], channel['intercept'], channel['rvalue']
+
                 summary = ('number of points = %3d\n' +
                            'slope\t= %4.5f\n' +
                            'intercept\t= %4.5f\n' +
                            'rvalue\t= %4.5f'
-                           ) % (len(x), res.slope, res.intercept, res.rvalue)
+                           ) % (len(x), slope, intercept, rvalue)
                 window['MULTI'].update(summary)
 
                 plt_summary = ('number of points = %3d\n' +
                                'slope = %4.5f\n' +
                                'intercept = %4.5f\n' +
                                'rvalue = %4.5f'
-                               ) % (len(x), res.slope, res.intercept, res.rvalue)
+                               ) % (len(x), slope, intercept, rvalue)
                 plt.text((min(x)+max(x))/2.0, min(y), plt_summary)
                 plt.show()
 
@@ -600,7 +654,7 @@ def run_gui() -> None:
                          title='ERROR')
 
         elif event == 'SAVE':
-            with open('servo_cal.yaml', mode="wt", encoding="utf-8") as cal_file:
+            with open(cal_path, mode="wt", encoding="utf-8") as cal_file:
 
                 for ch in range(16):
                     fit_cal_funtion(ch)
@@ -622,10 +676,15 @@ def run_gui() -> None:
 
         elif event == '-MOVE_SLIDER-':
             usec_val = values[event]
-            pca.goto_usec(current_channel, usec_val)
+            get_pca().goto_usec(current_channel, usec_val)
 
 
 if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        cal_path = sys.argv[1]
+
     logging.basicConfig(filename='calibrate.log',
                         filemode='w',
                         level=logging.WARNING)
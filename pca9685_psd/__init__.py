@@ -1,3 +1,40 @@
-from .servo import Servo
-from .pca9685 import PCA9685
+import importlib
 
+# The module that defines each public name.  A module, and NumPy, PyYAML
+# or smbus behind it, is only imported when one of its names is first
+# used, so importing the package is cheap and touches no hardware.
+_EXPORTS = {
+    'Servo':              'servo',
+    'ServoArray':         'servo_array',
+    'PCA9685':            'pca9685',
+    'RetryPolicy':        'pca9685',
+    'Instrument':         'instrument',
+    'LatencyHistogram':   'instrument',
+    'Recorder':           'recorder',
+    'AsyncServo':         'aio',
+    'AsyncPCA9685':       'aio',
+    'BusDispatcher':      'dispatch',
+    'OutputThread':       'output_thread',
+    'Trajectory':         'trajectory',
+    'Upsampler':          'upsample',
+    'Clip':               'trajectory',
+    'BusDaemon':          'daemon',
+    'ServoClient':        'client',
+    'Transport':          'transport',
+    'SMBusTransport':     'transport',
+    'SimulatedTransport': 'transport',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    globals()[name] = value     # later lookups do not come back here
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(list(globals()) + __all__)
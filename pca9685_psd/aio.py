@@ -0,0 +1,137 @@
+"""asyncio front ends for Servo and PCA9685
+
+The blocking bus work runs on a dedicated single thread executor, so the
+event loop is never blocked and the bus is only used from one thread.  The
+device init delays are done with asyncio.sleep().
+"""
+
+import asyncio
+import functools
+
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+from .pca9685 import PCA9685
+from .servo import Servo
+
+
+async def _run_steps(executor: ThreadPoolExecutor, steps) -> None:
+    """Run a step generator, each step on the executor and each delay on the loop."""
+
+    loop = asyncio.get_running_loop()
+    while True:
+        delay = await loop.run_in_executor(executor, next, steps, None)
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+
+
+class AsyncPCA9685:
+    """asyncio version of PCA9685, create it with  await AsyncPCA9685.create(...)"""
+
+    def __init__(self, pca: PCA9685, executor: ThreadPoolExecutor):
+
+        self.pca = pca
+        self.executor = executor
+
+    @classmethod
+    async def create(cls, executor: ThreadPoolExecutor = None, **kwargs) -> 'AsyncPCA9685':
+        """Open and initialize a PCA9685, kwargs are as for PCA9685.
+
+        Boards on the same bus may share an executor.
+        """
+
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pca9685-bus')
+
+        loop = asyncio.get_running_loop()
+        pca = await loop.run_in_executor(executor,
+                                         functools.partial(PCA9685, init_device=False, **kwargs))
+        self = cls(pca, executor)
+        await _run_steps(executor, pca._init_steps())
+        return self
+
+    async def __call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def write(self, reg: int, value: int) -> None:
+        """Writes an 8-bit value to the specified register/address."""
+        await self.__call(self.pca.write, reg, value)
+
+    async def read(self, reg: int) -> int:
+        """Read an unsigned byte from the I2C device."""
+        return await self.__call(self.pca.read, reg)
+
+    async def setPWMFreq(self, freq: float) -> None:
+        """Set the PWM frequency."""
+        await _run_steps(self.executor, self.pca._pwm_freq_steps(freq))
+
+    async def goto_usec(self, channel: int, usec: float) -> None:
+        """Update the pulse width on the specified channel."""
+        await self.__call(self.pca.goto_usec, channel, usec)
+
+    async def goto_16_usec(self, usec_array: Sequence[float]) -> None:
+        """Update the pulse widths on up to 16 channels."""
+        await self.__call(self.pca.goto_16_usec, usec_array)
+
+    def close(self) -> None:
+        """Stop the executor thread."""
+        self.executor.shutdown(wait=True)
+
+
+class AsyncServo:
+    """asyncio version of Servo, create it with  await AsyncServo.create(...)"""
+
+    def __init__(self, servo: Servo, executor: ThreadPoolExecutor):
+
+        self.servo = servo
+        self.executor = executor
+        self.pca = AsyncPCA9685(servo.pca, executor)
+
+    @classmethod
+    async def create(cls, executor: ThreadPoolExecutor = None, **kwargs) -> 'AsyncServo':
+        """Load the calibration and initialize the PCA9685, kwargs are as for Servo."""
+
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pca9685-bus')
+
+        loop = asyncio.get_running_loop()
+        servo = await loop.run_in_executor(executor,
+                                           functools.partial(Servo, init_device=False, **kwargs))
+        self = cls(servo, executor)
+        await _run_steps(executor, servo.pca._init_steps())
+        return self
+
+    async def __call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def move_16_radian(self, radians) -> None:
+        """Move all active servos to angles expressed in radians."""
+        await self.__call(self.servo.move_16_radian, radians)
+
+    async def move_16_radian_nolimit(self, radians) -> None:
+        """Move all active servos to angles expressed in radians, with no limit checks."""
+        await self.__call(self.servo.move_16_radian_nolimit, radians)
+
+    async def move_radian(self, channel_number, radian) -> None:
+        """Move a servo to an angle expressed in radians."""
+        await self.__call(self.servo.move_radian, channel_number, radian)
+
+    async def move_radian_nolimit(self, channel_number, radian) -> None:
+        """Move a servo to an angle expressed in radians, with no limit checks."""
+        await self.__call(self.servo.move_radian_nolimit, channel_number, radian)
+
+    async def move_usec(self, channel_number, usec) -> None:
+        """Move a servo to an angle expressed in microseconds, with no limit checks."""
+        await self.__call(self.servo.move_usec, channel_number, usec)
+
+    def radian_to_usec(self, channel_number, radian) -> float:
+        return self.servo.radian_to_usec(channel_number, radian)
+
+    def usec_to_radian(self, channel_number, usec) -> float:
+        return self.servo.usec_to_radian(channel_number, usec)
+
+    def close(self) -> None:
+        """Stop the output thread, if any, and the executor thread."""
+        self.servo.close()
+        self.executor.shutdown(wait=True)
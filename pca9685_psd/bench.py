@@ -0,0 +1,196 @@
+"""Measure the throughput of the servo driver hot path with no hardware.
+
+Run with:  python -m pca9685_psd.bench
+
+Each workload is a set of frames of 16 angles in radians.  Every frame is
+sent through the driver to a SimulatedTransport, which counts the I2C
+transactions and bytes.  The estimated bus time assumes the given I2C clock.
+"""
+
+import argparse
+import json
+import math
+import os
+import tempfile
+import time
+
+import yaml
+import numpy as np
+
+from .pca9685 import PCA9685
+from .servo import Servo
+from .transport import SimulatedTransport
+
+WORKLOADS = ('sinusoid', 'random_walk', 'mostly_static')
+TARGETS   = ('move_16_radian', 'move_radian', 'goto_16_usec')
+
+
+def make_workload(name: str, frames: int, frame_rate: float = 60.0, seed: int = 0) -> np.ndarray:
+    """Make a frames x 16 array of angles in radians."""
+
+    rng = np.random.default_rng(seed)
+
+    if name == 'sinusoid':
+        # Every joint swings at 1 Hz, each with its own phase, like a gait
+        t = np.arange(frames)[:, np.newaxis] / frame_rate
+        phase = np.linspace(0.0, 2.0 * math.pi, 16, endpoint=False)
+        radians = 0.3 * np.sin(2.0 * math.pi * t + phase)
+
+    elif name == 'random_walk':
+        steps = rng.normal(0.0, 0.01, size=(frames, 16))
+        radians = np.clip(np.cumsum(steps, axis=0), -0.5, 0.5)
+
+    elif name == 'mostly_static':
+        # Like a stance phase, only 2 to 4 joints move on any frame
+        radians = np.zeros((frames, 16))
+        current = np.zeros(16)
+        for i in range(frames):
+            moving = rng.choice(16, size=rng.integers(2, 5), replace=False)
+            current[moving] += rng.normal(0.0, 0.02, size=len(moving))
+            radians[i] = current
+
+    else:
+        raise ValueError('unknown workload: ' + str(name))
+
+    return radians
+
+
+def write_default_cal(path: str) -> None:
+    """Write a calibration file with a 180 degree servo on every channel."""
+
+    cal = dict()
+    for chan in range(16):
+        cal[chan] = {
+            'active': True,
+            'name': 'servo' + str(chan),
+            'slope': 1000.0 / math.pi,
+            'intercept': 1500.0,
+            'usec lower limit': 1000.0,
+            'usec upper limit': 2000.0,
+        }
+    with open(path, mode="wt", encoding="utf-8") as cal_file:
+        yaml.dump(cal, cal_file)
+
+
+def run_target(servo: Servo, target: str, radians: np.ndarray) -> float:
+    """Send every frame through one driver entry point, returns elapsed seconds."""
+
+    pca = servo.pca
+
+    if target == 'move_16_radian':
+        start = time.perf_counter()
+        for frame in radians:
+            servo.move_16_radian(frame)
+        return time.perf_counter() - start
+
+    if target == 'move_radian':
+        start = time.perf_counter()
+        for frame in radians:
+            for chan in range(16):
+                servo.move_radian(chan, frame[chan])
+        return time.perf_counter() - start
+
+    if target == 'goto_16_usec':
+        # Only the PCA9685 is timed, the conversion is done beforehand
+        usecs = np.fmin(np.fmax(servo.slope * radians + servo.intercept,
+                                servo.lower_limit), servo.upper_limit)
+        start = time.perf_counter()
+        for frame in usecs:
+            pca.goto_16_usec(frame)
+        return time.perf_counter() - start
+
+    raise ValueError('unknown target: ' + str(target))
+
+
+def run(frames: int = 2000,
+        workloads: tuple[str, ...] = WORKLOADS,
+        targets: tuple[str, ...] = TARGETS,
+        i2c_hz: float = 400000.0,
+        cal_file: str = None) -> list[dict]:
+    """Run every target on every workload and return one result per pair."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if cal_file is None:
+            cal_file = os.path.join(tmp_dir, 'servo_cal.yaml')
+            write_default_cal(cal_file)
+
+        results = []
+        for workload in workloads:
+            radians = make_workload(workload, frames)
+
+            for target in targets:
+                transport = SimulatedTransport()
+                servo = Servo(transport=transport, cal_file=cal_file)
+                servo.pca.pacing = PCA9685.PACING_NONE
+
+                # Start from a known output so the first frame is not special
+                servo.move_16_radian(radians[0])
+                transport.reset_counters()
+
+                elapsed = run_target(servo, target, radians)
+
+                tx_per_frame    = transport.transactions / frames
+                bytes_per_frame = transport.bytes_written / frames
+
+                # START, address byte and STOP per transaction, 9 bits per byte
+                bus_bits = transport.transactions * 11 + transport.bytes_written * 9
+
+                results.append({
+                    'workload': workload,
+                    'target': target,
+                    'frames': frames,
+                    'frames_per_sec': frames / elapsed,
+                    'usec_per_frame': 1000000.0 * elapsed / frames,
+                    'transactions_per_frame': tx_per_frame,
+                    'bytes_per_frame': bytes_per_frame,
+                    'bus_usec_per_frame': 1000000.0 * bus_bits / i2c_hz / frames,
+                })
+
+    return results
+
+
+def print_results(results: list[dict], i2c_hz: float) -> None:
+
+    print('%-14s %-15s %12s %12s %10s %10s %12s' %
+          ('workload', 'target', 'frames/s', 'usec/frame', 'tx/frame', 'B/frame',
+           'bus usec'))
+    for r in results:
+        print('%-14s %-15s %12.0f %12.1f %10.2f %10.2f %12.1f' %
+              (r['workload'], r['target'], r['frames_per_sec'], r['usec_per_frame'],
+               r['transactions_per_frame'], r['bytes_per_frame'], r['bus_usec_per_frame']))
+    print('bus usec is the estimated wire time at %.0f kHz' % (i2c_hz / 1000.0))
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='Benchmark the servo driver against a simulated PCA9685.')
+
+    parser.add_argument('--frames', type=int, default=2000,
+                        help='Number of frames in each workload.')
+    parser.add_argument('--workload', action='append', choices=WORKLOADS,
+                        help='Run only this workload, may be repeated.')
+    parser.add_argument('--target', action='append', choices=TARGETS,
+                        help='Run only this driver entry point, may be repeated.')
+    parser.add_argument('--i2c-hz', type=float, default=400000.0,
+                        help='I2C clock used to estimate the wire time.')
+    parser.add_argument('--cal', default=None,
+                        help='Calibration file, the default is a 180 degree servo on every channel.')
+    parser.add_argument('--json', action="store_const", const=True, default=False,
+                        help='Print the results as JSON, for tracking regressions.')
+
+    args = parser.parse_args()
+
+    results = run(frames=args.frames,
+                  workloads=tuple(args.workload or WORKLOADS),
+                  targets=tuple(args.target or TARGETS),
+                  i2c_hz=args.i2c_hz,
+                  cal_file=args.cal)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results, args.i2c_hz)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Drive servos through the bus-owner daemon, with the same calls as Servo
+
+ServoClient needs only the standard library, so a client process does not
+pay for NumPy or open the I2C bus.
+"""
+
+import socket
+import struct
+import threading
+
+from collections.abc import Sequence
+
+from . import protocol
+
+
+class ServoClient:
+    """A connection to a running pca9685_psd.daemon.
+
+    Channels are numbered as for ServoArray, channel g is channel g % 16 on
+    board g // 16.  Moves are sent and not waited for, the daemon writes
+    them at its next frame.  The conversions wait for the daemon's answer.
+    """
+
+    def __init__(self, socket_path: str = protocol.DEFAULT_SOCKET):
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.sock.connect(socket_path)
+        self.__lock = threading.Lock()
+
+        self.num_channels, self.frame_rate = self.__request(protocol.INFO, b'', protocol.INFO_REPLY)
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __send(self, kind: int, flags: int, count: int, body: bytes) -> None:
+        self.sock.send(protocol.HEADER.pack(kind, flags, count) + body)
+
+    def __request(self, kind: int, body: bytes, reply: struct.Struct) -> tuple:
+        """Send a message and wait for the reply of the same type."""
+
+        with self.__lock:
+            self.__send(kind, 0, 1, body)
+            data = self.sock.recv(protocol.MAX_MESSAGE)
+
+        if not data:
+            raise ConnectionError('the daemon closed the connection')
+        reply_kind, flags, count = protocol.HEADER.unpack_from(data)
+        if reply_kind != kind:
+            raise ConnectionError('expected a reply to message type %d, got %d' % (kind, reply_kind))
+        return reply.unpack_from(data, protocol.HEADER.size)
+
+    def __move_all(self, radians: Sequence[float], flags: int) -> None:
+        radians = [float(radian) for radian in radians]
+        self.__send(protocol.MOVE_ALL, flags, len(radians),
+                    struct.pack('<%df' % len(radians), *radians))
+
+    def __move_channels(self, kind: int, flags: int, values: dict[int, float]) -> None:
+        body = b''.join(protocol.CHANNEL_VALUE.pack(channel, value)
+                        for channel, value in values.items())
+        self.__send(kind, flags, len(values), body)
+
+    def move_16_radian(self, radians: Sequence[float]) -> None:
+        """Move servos 0 .. len(radians)-1 to angles expressed in radians."""
+        self.__move_all(radians, 0)
+
+    def move_16_radian_nolimit(self, radians: Sequence[float]) -> None:
+        """Move servos 0 .. len(radians)-1 to angles expressed in radians, with no limit checks."""
+        self.__move_all(radians, protocol.NOLIMIT)
+
+    move_all_radian = move_16_radian
+    move_all_radian_nolimit = move_16_radian_nolimit
+
+    def move_channels_radian(self, radians: dict[int, float]) -> None:
+        """Move several servos, radians maps channel numbers to angles, in one message."""
+        self.__move_channels(protocol.MOVE_CHANNELS, 0, radians)
+
+    def move_radian(self, channel_number: int, radian: float) -> None:
+        """Move a servo to an angle expressed in radians."""
+        self.__move_channels(protocol.MOVE_CHANNELS, 0, {channel_number: radian})
+
+    def move_radian_nolimit(self, channel_number: int, radian: float) -> None:
+        """Move a servo to an angle expressed in radians, with no limit checks."""
+        self.__move_channels(protocol.MOVE_CHANNELS, protocol.NOLIMIT, {channel_number: radian})
+
+    def move_usec(self, channel_number: int, usec: float) -> None:
+        """Move a servo to an angle expressed in microseconds, with no limit checks."""
+        self.__move_channels(protocol.MOVE_USEC, 0, {channel_number: usec})
+
+    def radian_to_usec(self, channel_number: int, radian: float) -> float:
+        return self.__request(protocol.RADIAN_TO_USEC,
+                              protocol.CONVERT.pack(channel_number, radian), protocol.VALUE)[0]
+
+    def usec_to_radian(self, channel_number: int, usec: float) -> float:
+        return self.__request(protocol.USEC_TO_RADIAN,
+                              protocol.CONVERT.pack(channel_number, usec), protocol.VALUE)[0]
@@ -0,0 +1,274 @@
+"""A daemon that owns the I2C bus and every PCA9685 on it
+
+Only the daemon opens the bus and initializes the boards, so several
+processes can drive servos without resetting each other.  Clients connect
+to a Unix domain socket, see protocol.py and ServoClient.  The latest
+command for each channel, from whichever client sent it, goes into one
+merged frame, and once per PWM period the channels that changed are written.
+
+    python -m pca9685_psd.daemon --cal servo_cal.yaml --addresses 0x40 0x41
+"""
+
+import argparse
+import logging
+import math
+import os
+import selectors
+import signal
+import socket
+import struct
+import time
+
+import numpy as np
+
+from . import protocol
+from .servo_array import ServoArray
+
+log = logging.getLogger(__name__)
+
+
+class BusDaemon:
+    """Serve clients on a Unix socket and write their merged commands to a ServoArray."""
+
+    def __init__(self,
+                 servos: ServoArray,
+                 socket_path: str = protocol.DEFAULT_SOCKET,
+                 socket_mode: int = 0o660):
+
+        self.servos = servos
+        self.num_channels = servos.num_channels
+        self.socket_path = socket_path
+        self.socket_mode = socket_mode
+        self.period = servos.pcas[0].pwm_period
+
+        # The merged frame starts as what the boards already have, and a
+        # channel no client has moved is never written
+        self.frame = np.concatenate([pca.last_off for pca in servos.pcas])
+        self.channels = np.zeros(self.num_channels, dtype=bool)
+        self.__dirty = False
+
+        self.__listener: socket.socket = None
+        self.__selector = selectors.DefaultSelector()
+        self.__stop = False
+
+        self.frames_written = 0
+        self.messages = 0
+
+    def serve_forever(self) -> None:
+        """Accept clients and write frames until stop() is called."""
+
+        self.__listen()
+        next_time = time.perf_counter()
+        try:
+            while not self.__stop:
+                timeout = max(next_time - time.perf_counter(), 0.0)
+                for key, events in self.__selector.select(timeout):
+                    if key.fileobj is self.__listener:
+                        self.__accept()
+                    else:
+                        self.__receive(key.fileobj)
+
+                now = time.perf_counter()
+                if now >= next_time:
+                    self.__write_frame()
+                    next_time += self.period
+                    if next_time < now:
+                        # Overran, skip the missed periods rather than bursting to catch up
+                        next_time = now + self.period
+        finally:
+            self.close()
+
+    def stop(self) -> None:
+        """Make serve_forever() return, this is safe to call from a signal handler."""
+
+        self.__stop = True
+
+    def close(self) -> None:
+        """Disconnect the clients and remove the socket."""
+
+        for key in list(self.__selector.get_map().values()):
+            self.__selector.unregister(key.fileobj)
+            key.fileobj.close()
+        if self.__listener is not None:
+            self.__listener = None
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+    def __listen(self) -> None:
+
+        # A socket file left by a daemon that was killed would make bind() fail
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+        self.__listener = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.__listener.bind(self.socket_path)
+        os.chmod(self.socket_path, self.socket_mode)
+        self.__listener.listen()
+        self.__listener.setblocking(False)
+        self.__selector.register(self.__listener, selectors.EVENT_READ)
+        log.info('listening on %s, %d channels at %.1f Hz',
+                 self.socket_path, self.num_channels, 1.0 / self.period)
+
+    def __accept(self) -> None:
+
+        conn, address = self.__listener.accept()
+        conn.setblocking(False)
+        self.__selector.register(conn, selectors.EVENT_READ)
+        log.info('client connected')
+
+    def __disconnect(self, conn: socket.socket) -> None:
+
+        self.__selector.unregister(conn)
+        conn.close()
+        log.info('client disconnected')
+
+    def __receive(self, conn: socket.socket) -> None:
+
+        try:
+            data = conn.recv(protocol.MAX_MESSAGE)
+        except BlockingIOError:
+            return
+        except OSError as error:
+            log.warning('client receive failed: %s', error)
+            data = b''
+        if not data:
+            self.__disconnect(conn)
+            return
+
+        self.messages += 1
+        try:
+            self.__handle(conn, data)
+        except (ValueError, IndexError, OverflowError, struct.error) as error:
+            # A client that sends nonsense is dropped, the others carry on
+            log.warning('bad message from client, disconnecting it: %s', error)
+            self.__disconnect(conn)
+        except BlockingIOError:
+            log.warning('client is not reading its replies, disconnecting it')
+            self.__disconnect(conn)
+        except OSError as error:
+            # Most likely the client went away before its reply was sent
+            log.info('client reply failed: %s', error)
+            self.__disconnect(conn)
+
+    def __handle(self, conn: socket.socket, data: bytes) -> None:
+        """Apply one message to the merged frame, or answer it."""
+
+        if len(data) < protocol.HEADER.size:
+            raise ValueError('short message')
+        kind, flags, count = protocol.HEADER.unpack_from(data)
+        body = data[protocol.HEADER.size:]
+        limit = not flags & protocol.NOLIMIT
+
+        if kind == protocol.MOVE_ALL:
+            if count > self.num_channels or len(body) != 4 * count:
+                raise ValueError('MOVE_ALL with %d channels and %d bytes' % (count, len(body)))
+            radians = np.zeros(self.num_channels)
+            radians[:count] = np.frombuffer(body, dtype='<f4', count=count)
+            if not np.isfinite(radians).all():
+                raise ValueError('MOVE_ALL with a value that is not finite')
+            self.frame[:count] = self.servos.radians_to_counts(radians, limit)[:count]
+            self.channels[:count] = True
+            self.__dirty = True
+
+        elif kind in (protocol.MOVE_CHANNELS, protocol.MOVE_USEC):
+            if len(body) != protocol.CHANNEL_VALUE.size * count:
+                raise ValueError('%d channel values in %d bytes' % (count, len(body)))
+            values = list(protocol.CHANNEL_VALUE.iter_unpack(body))
+            # Check the whole message first, so a bad one changes nothing
+            for channel, value in values:
+                if channel >= self.num_channels:
+                    raise IndexError('no channel %d' % channel)
+                if not math.isfinite(value):
+                    raise ValueError('channel %d value is not finite' % channel)
+            for channel, value in values:
+                if kind == protocol.MOVE_USEC:
+                    self.frame[channel] = round(value * self.servos.calibration.usec_to_count)
+                else:
+                    self.frame[channel] = self.servos.radian_to_count(channel, value, limit)
+                self.channels[channel] = True
+            self.__dirty = True
+
+        elif kind == protocol.INFO:
+            self.__reply(conn, kind, protocol.INFO_REPLY.pack(self.num_channels, 1.0 / self.period))
+
+        elif kind in (protocol.RADIAN_TO_USEC, protocol.USEC_TO_RADIAN):
+            if len(body) != protocol.CONVERT.size:
+                raise ValueError('conversion with %d bytes' % len(body))
+            channel, value = protocol.CONVERT.unpack_from(body)
+            if channel >= self.num_channels:
+                raise IndexError('no channel %d' % channel)
+            if kind == protocol.RADIAN_TO_USEC:
+                result = self.servos.radian_to_usec(channel, value)
+            else:
+                result = self.servos.usec_to_radian(channel, value)
+            self.__reply(conn, kind, protocol.VALUE.pack(result))
+
+        else:
+            raise ValueError('unknown message type %d' % kind)
+
+    def __reply(self, conn: socket.socket, kind: int, body: bytes) -> None:
+        conn.send(protocol.HEADER.pack(kind, 0, 1) + body)
+
+    def __write_frame(self) -> None:
+        """Write the merged frame, only the channels that changed go on the bus."""
+
+        if not self.__dirty:
+            return
+        self.__dirty = False
+        try:
+            self.servos.move_all_counts(self.frame, self.channels)
+            self.frames_written += 1
+        except OSError as error:
+            log.warning('frame write failed: %s', error)
+
+
+def main(argv: list[str] = None) -> None:
+
+    parser = argparse.ArgumentParser(
+        prog='python -m pca9685_psd.daemon',
+        description='Own the I2C bus and the PCA9685 boards, and serve clients on a Unix socket.')
+    parser.add_argument('--socket', default=protocol.DEFAULT_SOCKET,
+                        help='the Unix socket path (default %(default)s)')
+    parser.add_argument('--mode', type=lambda text: int(text, 8), default=0o660,
+                        help='the socket file permissions, in octal (default 660)')
+    parser.add_argument('--cal', default='servo_cal.yaml',
+                        help='the calibration file, 16 channels per board (default %(default)s)')
+    parser.add_argument('--addresses', type=lambda text: int(text, 0), nargs='+', default=[0x40],
+                        help='the board I2C addresses (default 0x40)')
+    parser.add_argument('--smbus', type=int, default=1,
+                        help='the I2C bus number (default %(default)s)')
+    parser.add_argument('--attach', action='store_true',
+                        help='leave boards that are already set up running')
+    parser.add_argument('--noi2c', action='store_true',
+                        help='drive simulated boards, for testing')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    servos = ServoArray(addresses=args.addresses,
+                        smbus_number=args.smbus,
+                        noi2c=args.noi2c,
+                        cal_file=args.cal,
+                        attach=args.attach)
+    daemon = BusDaemon(servos, args.socket, args.mode)
+
+    def on_signal(signum, stack_frame):
+        daemon.stop()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    try:
+        daemon.serve_forever()
+    finally:
+        servos.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Write frames to PCA9685 boards on several I2C buses in parallel"""
+
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+from .pca9685 import PCA9685
+
+
+class BusDispatcher:
+    """Fan one frame out to boards on several I2C buses and wait for all of them.
+
+    Boards are grouped by bus, the SMBus number of their transport or else
+    the transport object.  Each group after the first has its own worker
+    thread, the first group is written on the calling thread.  The smbus ioctl releases the GIL while a
+    transfer is on the wire, so the buses run at the same time and a frame
+    takes as long as the slowest bus instead of the sum of all buses.
+    """
+
+    def __init__(self, pcas: Sequence[PCA9685]):
+
+        self.pcas = list(pcas)
+        if not self.pcas:
+            raise ValueError('BusDispatcher needs at least one PCA9685')
+
+        groups: dict[tuple, list[int]] = {}
+        for indx, pca in enumerate(self.pcas):
+            groups.setdefault(self.bus_key(pca), []).append(indx)
+        self.groups: list[list[int]] = list(groups.values())
+
+        self.__executors = [ThreadPoolExecutor(max_workers=1, thread_name_prefix='pca9685-bus')
+                            for group in self.groups[1:]]
+
+    @staticmethod
+    def bus_key(pca: PCA9685) -> tuple:
+        """A key for the bus a board is on, equal for boards on the same bus."""
+
+        # PCA9685s made with the same smbus_number each open their own
+        # SMBusTransport, but they share one adapter
+        smbus_number = getattr(pca.bus, 'smbus_number', None)
+        if smbus_number is not None:
+            return ('smbus', smbus_number)
+        return ('transport', id(pca.bus))
+
+    def __write_group(self, group: list[int], method: str, *per_board) -> None:
+        for indx in group:
+            getattr(self.pcas[indx], method)(*[values[indx] for values in per_board])
+
+    def __fan_out(self, method: str, *per_board) -> None:
+
+        futures = [executor.submit(self.__write_group, group, method, *per_board)
+                   for executor, group in zip(self.__executors, self.groups[1:])]
+        try:
+            self.__write_group(self.groups[0], method, *per_board)
+        finally:
+            for future in futures:
+                future.result()
+
+    def goto_16_usec(self, frames: Sequence[Sequence[float]]) -> None:
+        """Send frames[i], in microseconds, to board i, returns when every bus is done.
+
+        If a bus fails its exception is raised here, after the other buses finish.
+        """
+
+        self.__fan_out('goto_16_usec', frames)
+
+    def goto_16_counts(self, frames: Sequence[Sequence[int]], channels: Sequence = None) -> None:
+        """Send frames[i], in 12-bit counts, to board i, returns when every bus is done.
+
+        channels[i], if given, is the channel mask for board i, see PCA9685.goto_16_counts().
+        If a bus fails its exception is raised here, after the other buses finish.
+        """
+
+        if channels is None:
+            channels = [None] * len(self.pcas)
+        self.__fan_out('goto_16_counts', frames, channels)
+
+    def close(self) -> None:
+        """Stop the worker threads."""
+
+        for executor in self.__executors:
+            executor.shutdown(wait=True)
+        self.__executors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,147 @@
+"""Per frame timing and bus counters for the hot path
+
+Instrumentation is off unless an Instrument is passed to PCA9685 or Servo.
+When it is off the hot path only tests one attribute for None.
+"""
+
+import math
+
+from collections.abc import Callable
+
+
+class LatencyHistogram:
+    """A histogram of durations with log spaced buckets, four per octave.
+
+    Recording a value is a frexp() and a list increment, so it is cheap
+    enough to call every frame.  Percentiles are the upper edge of their
+    bucket, within about 20% of the true value, the maximum is exact.
+    """
+
+    # Four buckets per octave from 1 usec up to about 16 seconds
+    SUB_BUCKETS = 4
+    NUM_BUCKETS = 4 * 25
+
+    def __init__(self):
+
+        self.reset()
+
+    def reset(self) -> None:
+        self.buckets = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total_usec = 0.0
+        self.max_usec = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Add one duration, in seconds."""
+
+        usec = seconds * 1000000.0
+        mantissa, exponent = math.frexp(usec)
+        indx = self.SUB_BUCKETS * exponent + int((mantissa - 0.5) * 2 * self.SUB_BUCKETS)
+        if indx < 0:
+            indx = 0
+        elif indx >= self.NUM_BUCKETS:
+            indx = self.NUM_BUCKETS - 1
+        self.buckets[indx] += 1
+
+        self.count += 1
+        self.total_usec += usec
+        if usec > self.max_usec:
+            self.max_usec = usec
+
+    def __upper_edge(self, indx: int) -> float:
+        exponent, sub = divmod(indx, self.SUB_BUCKETS)
+        return math.ldexp(0.5 + (sub + 1) / (2.0 * self.SUB_BUCKETS), exponent)
+
+    def percentile(self, pct: float) -> float:
+        """The duration, in usec, that pct percent of the values do not exceed."""
+
+        if self.count == 0:
+            return 0.0
+
+        target = max(1, math.ceil(self.count * pct / 100.0))
+        seen = 0
+        for indx, num in enumerate(self.buckets):
+            seen += num
+            if seen >= target:
+                return min(self.__upper_edge(indx), self.max_usec)
+        return self.max_usec
+
+    def summary(self) -> dict:
+        """count, mean, p50, p99 and max, the durations in usec."""
+
+        return {'count': self.count,
+                'mean':  self.total_usec / self.count if self.count else 0.0,
+                'p50':   self.percentile(50.0),
+                'p99':   self.percentile(99.0),
+                'max':   self.max_usec}
+
+
+class Instrument:
+    """Counters and latency histograms for the frames written by a PCA9685.
+
+    PCA9685.goto_16_counts() records, for each frame, the time spent writing
+    it, the I2C transactions and bytes sent, the retries and the number of
+    active channels skipped because they had not moved past their deadband.
+    Servo records the time spent converting radians to counts, which goes
+    in the convert histogram and in the record of the next frame written.
+
+    callback, if given, is called with a dict for every frame, for export
+    to a telemetry system.  It runs in the thread that writes the frame so
+    it should be quick.
+    """
+
+    def __init__(self, callback: Callable[[dict], None] = None):
+
+        self.callback = callback
+        self.convert = LatencyHistogram()
+        self.write   = LatencyHistogram()
+        self.reset()
+
+    def reset(self) -> None:
+        """Clear the counters and histograms."""
+
+        self.convert.reset()
+        self.write.reset()
+        self.frames           = 0
+        self.transactions     = 0
+        self.bytes_written    = 0
+        self.retries          = 0
+        self.skipped_channels = 0
+        self.last_convert     = 0.0
+
+    def record_convert(self, seconds: float) -> None:
+        """Record the time taken to convert one frame to counts."""
+
+        self.convert.record(seconds)
+        self.last_convert = seconds
+
+    def record_frame(self, seconds: float, transactions: int, bytes_written: int,
+                     retries: int, skipped: int) -> None:
+        """Record one frame written, seconds is the time goto_16_counts() took."""
+
+        self.write.record(seconds)
+        self.frames           += 1
+        self.transactions     += transactions
+        self.bytes_written    += bytes_written
+        self.retries          += retries
+        self.skipped_channels += skipped
+
+        if self.callback is not None:
+            self.callback({'convert_usec':  self.last_convert * 1000000.0,
+                           'write_usec':    seconds * 1000000.0,
+                           'transactions':  transactions,
+                           'bytes_written': bytes_written,
+                           'retries':       retries,
+                           'skipped':       skipped})
+        self.last_convert = 0.0
+
+    def snapshot(self) -> dict:
+        """The totals and the latency summaries, in usec."""
+
+        return {'frames':           self.frames,
+                'transactions':     self.transactions,
+                'bytes_written':    self.bytes_written,
+                'retries':          self.retries,
+                'skipped_channels': self.skipped_channels,
+                'convert_usec':     self.convert.summary(),
+                'write_usec':       self.write.summary()}
@@ -0,0 +1,151 @@
+"""Write servo frames to a PCA9685 at a fixed rate from a background thread"""
+
+import logging
+import threading
+import time
+
+from collections.abc import Callable, Sequence
+
+import numpy as np
+
+from .pca9685 import PCA9685
+
+log = logging.getLogger(__name__)
+
+
+class OutputThread:
+    """Flush the newest frame to a PCA9685 once per PWM period.
+
+    submit() copies the 12-bit counts into the back buffer and returns at once,
+    the bus I/O happens on the output thread.  Once per period the thread copies
+    the back buffer to the front buffer and writes the front buffer.  The latest
+    value wins: a frame replaced by a newer one before it was written is counted
+    as superseded, and a period the thread could not write in time is counted as
+    dropped.
+
+    With a frame_source, such as Upsampler.frame(), the thread instead calls
+    frame_source(time.perf_counter()) each period and writes the counts and
+    channel mask it returns, or nothing if it returns None.  Submitted frames
+    are ignored.
+    """
+
+    def __init__(self,
+                 pca: PCA9685,
+                 frequency: float = None,
+                 frame_source: Callable[[float], tuple[np.ndarray, np.ndarray]] = None):
+
+        self.pca = pca
+        self.frame_source = frame_source
+        # By default one frame per PWM period, as the chip really runs it
+        if frequency is None:
+            self.period = pca.pwm_period
+        else:
+            self.period = 1.0 / frequency
+
+        # Start from what the chip already has so unset channels are not moved.
+        # A channel whose pulse width is not known is left out of the frames
+        # until a value is submitted for it.
+        self.__back  = np.array(pca.last_off, dtype=np.int16)
+        self.__front = self.__back.copy()
+        self.__back_set  = ~pca.off_unknown
+        self.__front_set = self.__back_set.copy()
+        self.__pending = False
+
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread: threading.Thread = None
+
+        self.frames_submitted  = 0
+        self.frames_written    = 0
+        self.frames_superseded = 0
+        self.frames_dropped    = 0
+
+    def start(self) -> None:
+        """Start the output thread."""
+
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, name='pca9685-output', daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """Stop the output thread, a pending frame is not written."""
+
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def submit(self, counts: Sequence[int], channels: np.ndarray = None) -> None:
+        """Queue pulse widths in counts for up to 16 channels, replacing any unwritten frame.
+
+        channels, a mask of 16 bools, takes only those channels from counts.
+        """
+
+        with self.__lock:
+            if channels is None:
+                self.__back[:] = counts
+                self.__back_set[:] = True
+            else:
+                np.copyto(self.__back, counts, where=channels, casting='unsafe')
+                self.__back_set |= channels
+            if self.__pending:
+                self.frames_superseded += 1
+            self.__pending = True
+            self.frames_submitted += 1
+
+    def submit_channel(self, channel: int, count: int) -> None:
+        """Queue a new pulse width in counts for one channel, the others keep their latest values."""
+
+        with self.__lock:
+            self.__back[channel] = count
+            self.__back_set[channel] = True
+            self.__pending = True
+
+    def stats(self) -> dict:
+        """The frame counters."""
+
+        return {'submitted':  self.frames_submitted,
+                'written':    self.frames_written,
+                'superseded': self.frames_superseded,
+                'dropped':    self.frames_dropped}
+
+    def __take_frame(self) -> np.ndarray:
+        """The front buffer with the newest submitted frame, None if nothing new was submitted."""
+
+        with self.__lock:
+            if not self.__pending:
+                return None
+            np.copyto(self.__front, self.__back)
+            np.copyto(self.__front_set, self.__back_set)
+            self.__pending = False
+        return self.__front
+
+    def __run(self) -> None:
+
+        next_time = time.perf_counter()
+        while not self.__stop.is_set():
+            next_time += self.period
+
+            try:
+                if self.frame_source is not None:
+                    frame, channels = self.frame_source(time.perf_counter()) or (None, None)
+                else:
+                    frame = self.__take_frame()
+                    channels = self.__front_set
+                if frame is not None:
+                    self.pca.goto_16_counts(frame, channels)
+                    self.frames_written += 1
+            except Exception:
+                log.exception('output thread frame write failed')
+
+            wait = next_time - time.perf_counter()
+            if wait < 0.0:
+                # Overran, skip the missed periods rather than bursting to catch up
+                missed = int(-wait / self.period) + 1
+                self.frames_dropped += missed
+                next_time += missed * self.period
+                wait += missed * self.period
+            self.__stop.wait(wait)
@@ -1,16 +1,46 @@
 """PCA9685 16-Channel PWM Servo Driver"""
 
+import errno
+import logging
 import time
 import math
 
-"""
-We can use either the smbus or subus2 package.
-Be sure the used is a member of the i2c group
-"""
-import smbus
-#import smbus2 as smbus
+from collections.abc import Iterator, Sequence
+
+import numpy as np
+
+from .instrument import Instrument
+from .recorder import Recorder
+from .transport import Transport, SMBusTransport
+
+log = logging.getLogger(__name__)
+
+
+class RetryPolicy:
+    """How PCA9685 handles a failed LEDn or ALL_LED write.
+
+    An OSError with an errno in transient_errnos is retried, up to
+    max_attempts tries in all.  The first retry waits backoff_usec and each
+    later one waits backoff_factor times longer.  Other errors are not retried.
+    When a write gives up its registers are marked unknown so the next frame
+    repairs them, and with raise_on_failure the error is raised once the
+    rest of the frame has been written.
+    """
+
+    def __init__(self,
+                 max_attempts: int = 2,
+                 backoff_usec: float = 0.0,
+                 backoff_factor: float = 2.0,
+                 transient_errnos: Sequence[int] = (errno.EIO, errno.EREMOTEIO, errno.ETIMEDOUT,
+                                                    errno.EAGAIN, errno.EBUSY, errno.ENXIO),
+                 raise_on_failure: bool = False):
+
+        self.max_attempts = max_attempts
+        self.backoff_usec = backoff_usec
+        self.backoff_factor = backoff_factor
+        self.transient_errnos = frozenset(transient_errnos)
+        self.raise_on_failure = raise_on_failure
 
-from collections.abc import Sequence
 
 class PCA9685:
 
@@ -19,6 +49,7 @@ class PCA9685:
     __SUBADR2            = 0x03
     __SUBADR3            = 0x04
     __MODE1              = 0x00
+    __MODE2              = 0x01
     __PRESCALE           = 0xFE
     __LED0_ON_L          = 0x06
     __LED0_ON_H          = 0x07
@@ -29,6 +60,46 @@ class PCA9685:
     __ALLLED_OFF_L       = 0xFC
     __ALLLED_OFF_H       = 0xFD
 
+    # MODE1 bits
+    __SLEEP              = 0x10
+    __AUTO_INCREMENT     = 0x20
+    __RESTART            = 0x80
+
+    # MODE2 bits
+    __OUTDRV             = 0x04     # totem pole outputs, the power-on default
+    __OCH                = 0x08     # outputs change on ACK, not on STOP
+
+    # Frame alignment keeps this far away from the pulses and the period end
+    __ALIGN_GUARD        = 0.0002
+
+    # Bit 4 of LEDn_ON_H / LEDn_OFF_H, the output is fully on / off
+    __FULL               = 0x10
+
+    # An SMBus block write carries at most 32 data bytes, that is 8 channels
+    __BLOCK_MAX          = 32
+    __BLOCK_MAX_CHANNELS = 8
+
+    # Rewriting up to this many unchanged bytes costs less than another
+    # transaction, its START, address, register and STOP on the wire plus
+    # the ioctl.  Three bridges OFF_H, ON_L, ON_H between two OFF_L changes.
+    __MAX_BRIDGE         = 3
+
+    # Bus pacing policies, the gap between I2C transactions is pacing_usec
+    PACING_NONE          = 'none'       # no delay at all
+    PACING_MIN_GAP       = 'min_gap'    # wait only if the last transaction was too recent
+    PACING_FIXED         = 'fixed'      # sleep before every transaction
+
+    # PRESCALE limits, the chip will not take less than 3
+    __PRESCALE_MIN       = 3
+    __PRESCALE_MAX       = 255
+
+    # The 25 MHz internal oscillator and the 12-bit counter
+    __OSC_HZ             = 25000000.0
+    __COUNTS             = 4096
+
+    # Spinning is more accurate than time.sleep() for waits shorter than this
+    __SPIN_LIMIT         = 0.001
+
     delay = 0.025
 
     def __init__(self,
@@ -36,13 +107,24 @@ class PCA9685:
                  address: int = 0x40,
                  bus_frequency: float = 60.0,
                  active_channels: list[int] = [c for c in range(16)],
-                 clock_correction = 0.920):
+                 clock_correction = 0.920,
+                 block_write: bool = True,
+                 pacing: str = PACING_MIN_GAP,
+                 pacing_usec: float = 100.0,
+                 transport: Transport = None,
+                 init_device: bool = True,
+                 deadband: int | Sequence[int] = 0,
+                 atomic: bool = False,
+                 frame_align: bool = False,
+                 attach: bool = False,
+                 retry: RetryPolicy = None,
+                 instrument: Instrument = None,
+                 recorder: Recorder = None):
 
         self.address = address
         self.active_channels = active_channels.copy()
         self.bus_frequency = bus_frequency
-        self.bus_period_usec = (1.0 / bus_frequency) * 1000000.0
-        
+
         # To find clock_correction, set it to 1.0 then mesure width of a 1 ms pulse
         # if the actual width is (say) 0.950 ms then set clock corection to 0.950
         # when the corect is corect a 1000 uSec pulse will measure to within
@@ -50,50 +132,340 @@ class PCA9685:
         # be an integer
         self.clock_correction = clock_correction
 
-
-        self.bus = smbus.SMBus(smbus_number)
-        time.sleep(self.delay)
-
-        self.write(self.__MODE1, 0x00)
-        time.sleep(self.delay)
-
-        self.setPWMFreq(bus_frequency)
-        time.sleep(self.delay)
-
-        self.last_off: list[int] = [0     for i in range(16)]
-        self.on2zero: list[bool] = [False for i in range(16)]
+        # PRESCALE is an integer, so the chip runs at a frequency near
+        # bus_frequency, not at it.  Counts are worked out from the period
+        # it really runs at.
+        self.__set_period(self.prescale(bus_frequency))
+
+        # With block writes the register pointer auto-increments so that
+        # a run of LEDn_ON_L..LEDn_OFF_H registers goes out in one transaction.
+        # Some I2C adapters can not do block writes, they can turn this off.
+        self.block_write = block_write or atomic
+        self.mode1 = self.__AUTO_INCREMENT if self.block_write else 0x00
+
+        # In atomic mode MODE2 OCH is set, so a channel's output changes only
+        # once all four of its registers are loaded, and every channel is
+        # written as one four byte block.  It can never show a half written value.
+        self.atomic = atomic
+        self.mode2 = self.__OUTDRV | (self.__OCH if atomic else 0x00)
+
+        # With frame_align, goto_16_counts() waits until the pulses of the
+        # current PWM period are over and writes the frame before the next
+        # period starts, so the whole frame takes effect in the next period.
+        # The chip's phase can not be read back and the clock correction is
+        # only good to about 1%, so the phase has to come from a measured
+        # period start, such as a GPIO edge from a spare channel, passed to
+        # sync_phase() at least every phase_max_age seconds.  Until then, or
+        # once the last one is older than that, frames are written at once
+        # and counted in unaligned_frames.  The phase drifts by the clock
+        # error times its age, which must stay well inside the 200 usec guard.
+        self.frame_align = frame_align
+        self.phase_anchor: float = None
+        self.phase_max_age: float = 0.1
+        self.frame_write_time: float = 0.001
+        self.unaligned_frames = 0
+        self.__anchor_time: float = 0.0
+
+        # Pacing applies to every bus transaction.  The device init sleeps
+        # (delay) are separate and are not affected by this.
+        if pacing not in (self.PACING_NONE, self.PACING_MIN_GAP, self.PACING_FIXED):
+            raise ValueError('unknown pacing policy: ' + str(pacing))
+        self.pacing = pacing
+        self.pacing_usec = pacing_usec
+        self.last_transaction: float = 0.0
+
+        # The transport is normally the real I2C bus.  Pass a SimulatedTransport
+        # to run with no hardware, or share one transport between boards on a bus.
+        if transport is None:
+            transport = SMBusTransport(smbus_number)
+        self.bus = transport
+
+        # Shadow of every register written, -1 where the value is not known.
+        # Only the bytes that differ from it are sent.
+        self.regs = np.full(256, -1, dtype=np.int16)
+
+        # Shadow of the pulse width sent to each channel.  A channel is only
+        # written when its count moves by more than its deadband from last_off.
+        # off_unknown marks the channels that are not outputting a known plain
+        # pulse, after a failed write or a full on/off, their last_off means
+        # nothing and the next frame rewrites them whatever the deadband.
+        self.last_off = np.zeros(16, dtype=np.int32)
+        self.off_unknown = np.zeros(16, dtype=bool)
+        self.on2zero  = np.zeros(16, dtype=bool)
+        self.active_mask = np.zeros(16, dtype=bool)
+        self.active_mask[self.active_channels] = True
+        self.deadband = np.zeros(16, dtype=np.int32)
+        self.deadband[:] = deadband
+
+        # Failed LEDn writes, see RetryPolicy.  write_errors counts failed
+        # transactions, retries the ones tried again, and write_failures the
+        # writes that were given up on.
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.write_errors   = 0
+        self.retries        = 0
+        self.write_failures = 0
+        self.last_error: OSError = None
+        self.__frame_error: OSError = None
+
+        # Every write transaction and its bytes, register byte included,
+        # as they go on the wire.  Failed transactions count too.
+        self.transactions  = 0
+        self.bytes_written = 0
+
+        # Per frame timing and counters, None turns them off
+        self.instrument = instrument
+
+        # Ring buffer of the frames written, None turns it off
+        self.recorder = recorder
+
+        # With attach, a chip that is already set up the way we would set it
+        # up is left running, so a restarted process does not make the
+        # servos twitch.  Otherwise the chip is reset as usual.
+        self.attach = attach
+        self.attached = False
+
+        # With init_device=False the caller runs _init_steps() itself, this
+        # is how AsyncPCA9685 does the init sleeps with asyncio.sleep().
+        if init_device:
+            for delay in self._init_steps():
+                time.sleep(delay)
+
+    def _init_steps(self) -> Iterator[float]:
+        """Reset the chip and set the PWM frequency, yields the delay needed after each step."""
+
+        if self.attach and self.__is_configured():
+            self.__seed_shadow()
+            self.attached = True
+            return
+
+        yield self.delay
+
+        self.write(self.__MODE1, self.mode1)
+        yield self.delay
+
+        self.write(self.__MODE2, self.mode2)
+        yield self.delay
+
+        yield from self._pwm_freq_steps(self.bus_frequency)
+        yield self.delay
     
     def write(self, reg: int, value: int) -> None:
         """"Writes an 8-bit value to the specified register/address."""
-        time.sleep(0.0001)
+        self.pace()
+        self.transactions  += 1
+        self.bytes_written += 2
         self.bus.write_byte_data(self.address, reg, value)
+        self.last_transaction = time.perf_counter()
+        self.regs[reg] = value
+
+    def write_block(self, reg: int, data: list[int]) -> None:
+        """Writes a run of 8-bit values starting at the specified register.
+
+        The MODE1 auto-increment bit must be set, which it is when
+        block_write is enabled.
+        """
+        self.pace()
+        self.transactions  += 1
+        self.bytes_written += 1 + len(data)
+        self.bus.write_i2c_block_data(self.address, reg, data)
+        self.last_transaction = time.perf_counter()
+        self.regs[reg:reg + len(data)] = data
       
     def read(self, reg: int) -> int:
         """Read an unsigned byte from the I2C device."""
+        self.pace()
         result = self.bus.read_byte_data(self.address, reg)
+        self.last_transaction = time.perf_counter()
         return result
-    
+
+    def read_block(self, reg: int, length: int) -> list[int]:
+        """Read a run of up to 32 unsigned bytes starting at the specified register."""
+        self.pace()
+        result = self.bus.read_i2c_block_data(self.address, reg, length)
+        self.last_transaction = time.perf_counter()
+        return result
+
+    def __is_configured(self) -> bool:
+        """True if MODE1, MODE2 and PRESCALE already hold what init would write."""
+
+        mode1 = self.read(self.__MODE1) & ~self.__RESTART
+        if mode1 != self.mode1:
+            return False
+        if self.read(self.__MODE2) != self.mode2:
+            return False
+        prescale = self.prescale(self.bus_frequency)
+        if self.read(self.__PRESCALE) != prescale:
+            return False
+
+        self.regs[self.__MODE1]    = self.mode1
+        self.regs[self.__MODE2]    = self.mode2
+        self.regs[self.__PRESCALE] = prescale
+        return True
+
+    def __seed_shadow(self) -> None:
+        """Set last_off and on2zero from the LEDn registers."""
+
+        if self.block_write:
+            regs = (self.read_block(self.__LED0_ON_L, 32) +
+                    self.read_block(self.__LED0_ON_L + 32, 32))
+        else:
+            regs = [self.read(self.__LED0_ON_L + i) for i in range(64)]
+        self.regs[self.__LED0_ON_L:self.__LED0_ON_L + 64] = regs
+
+        for chan_indx in range(16):
+            on_l, on_h, off_l, off_h = regs[4 * chan_indx: 4 * chan_indx + 4]
+            self.on2zero[chan_indx] = (on_l == 0 and on_h == 0)
+            if self.on2zero[chan_indx] and not off_h & self.__FULL:
+                self.last_off[chan_indx] = off_l | (off_h << 8)
+                self.off_unknown[chan_indx] = False
+            else:
+                self.last_off[chan_indx] = 0
+                self.off_unknown[chan_indx] = True
+
+    def pace(self) -> None:
+        """Wait as required by the pacing policy before a bus transaction."""
+
+        if self.pacing == self.PACING_NONE:
+            return
+
+        gap = self.pacing_usec / 1000000.0
+        if self.pacing == self.PACING_FIXED:
+            wait = gap
+        else:
+            # perf_counter() is monotonic so wall clock changes do not matter
+            wait = self.last_transaction + gap - time.perf_counter()
+            if wait <= 0.0:
+                return
+
+        self.__sleep(wait)
+
+    def __sleep(self, wait: float) -> None:
+        """Sleep, or spin if the wait is too short for time.sleep() to be accurate."""
+
+        if wait >= self.__SPIN_LIMIT:
+            time.sleep(wait)
+        else:
+            deadline = time.perf_counter() + wait
+            while time.perf_counter() < deadline:
+                pass
+
+    def sync_phase(self, period_start: float) -> None:
+        """Set the PWM phase from a measured period start, a time.perf_counter() value."""
+
+        self.phase_anchor = period_start
+        self.__anchor_time = time.perf_counter()
+
+    def __wait_for_window(self, max_off: int) -> None:
+        """Wait until a frame can be written between the end of the pulses and the period end."""
+
+        if self.phase_anchor is None or time.perf_counter() - self.__anchor_time > self.phase_max_age:
+            # Waiting on a phase that has drifted away only adds latency
+            self.unaligned_frames += 1
+            return
+
+        period = self.pwm_period
+        window_open  = max_off * period / 4096.0 + self.__ALIGN_GUARD
+        window_close = period - self.frame_write_time - self.__ALIGN_GUARD
+        if window_open > window_close:
+            return      # the frame can not fit, write it now
+
+        phase = (time.perf_counter() - self.phase_anchor) % period
+        if phase < window_open:
+            self.__sleep(window_open - phase)
+        elif phase > window_close:
+            self.__sleep(period - phase + window_open)
+
     def setPWMFreq(self, freq: float) -> None:
         """Set the PWM frequency."""
 
-        prescaleval = 25000000.0 / self.clock_correction   # 25MHz
-        prescaleval /= 4096.0       # 12-bit
+        for delay in self._pwm_freq_steps(freq):
+            time.sleep(delay)
+
+    def prescale(self, freq: float) -> int:
+        """The PRESCALE register value for a PWM frequency, 3 .. 255 (about 24 Hz to 1.5 kHz)."""
+
+        prescaleval = self.__OSC_HZ / self.clock_correction   # 25MHz
+        prescaleval /= float(self.__COUNTS)     # 12-bit
         prescaleval /= float(freq)
         prescaleval -= 1.0
         prescale = math.floor(prescaleval + 0.5)
+        return min(max(prescale, self.__PRESCALE_MIN), self.__PRESCALE_MAX)
+
+    def __set_period(self, prescale: int) -> None:
+        """Set pwm_period and bus_period_usec from a PRESCALE value."""
+
+        self.pwm_period = (prescale + 1) * self.__COUNTS * self.clock_correction / self.__OSC_HZ
+        self.bus_period_usec = self.pwm_period * 1000000.0
+
+    @property
+    def usec_per_count(self) -> float:
+        """The pulse width resolution, one 12-bit count in usec."""
+
+        return self.bus_period_usec / self.__COUNTS
+
+    def bus_budget(self, i2c_hz: float = 400000.0) -> dict:
+        """What the I2C bus can carry at the PWM frame rate, from the bits on the wire.
+
+        A full frame rewrites all four registers of every active channel.
+        Returns the frame rate and period, usec_per_count, the bus time of a
+        full frame, the highest full frame rate the bus can carry, and the
+        most channels that can be updated in every PWM period.  The time each
+        transaction spends in the kernel is not included, so a real bus
+        manages somewhat less.
+        """
+
+        def transaction_usec(data_bytes: int) -> float:
+            # START, address and STOP, then the register and the data bytes
+            wire = (11 + 9 * (1 + data_bytes)) * 1000000.0 / i2c_hz
+            if self.pacing == self.PACING_FIXED:
+                return wire + self.pacing_usec
+            if self.pacing == self.PACING_MIN_GAP:
+                return max(wire, self.pacing_usec)
+            return wire
+
+        def frame_usec(num_channels: int) -> float:
+            if self.block_write:
+                full, rest = divmod(num_channels, self.__BLOCK_MAX_CHANNELS)
+                usec = full * transaction_usec(self.__BLOCK_MAX)
+                if rest:
+                    usec += transaction_usec(4 * rest)
+                return usec
+            return 4 * num_channels * transaction_usec(1)
+
+        num_active = max(int(np.count_nonzero(self.active_mask)), 1)
+        full_frame_usec = frame_usec(num_active)
+
+        max_channels = 0
+        while max_channels < 16 and frame_usec(max_channels + 1) <= self.bus_period_usec:
+            max_channels += 1
+
+        return {'frame_rate':             1.0 / self.pwm_period,
+                'frame_period_usec':      self.bus_period_usec,
+                'usec_per_count':         self.usec_per_count,
+                'full_frame_usec':        full_frame_usec,
+                'max_full_frame_rate':    1000000.0 / full_frame_usec,
+                'max_channels_per_frame': max_channels}
+
+    def _pwm_freq_steps(self, freq: float) -> Iterator[float]:
+        """Set the PWM frequency, yields the delay needed after each step."""
+
+        prescale = self.prescale(freq)
         
         # print('PCA9685 using prescale value = ', prescale, '  freq =', freq)
 
         # oldmode = self.read(self.__MODE1)
         #newmode = (oldmode & 0x7F) | 0x10        # sleep
-        self.write(self.__MODE1, 0x10)        # go to sleep
-        time.sleep(self.delay)
+        self.write(self.__MODE1, self.mode1 | self.__SLEEP)        # go to sleep
+        yield self.delay
 
         self.write(self.__PRESCALE, int(prescale))
-        time.sleep(self.delay)
+        yield self.delay
 
-        self.write(self.__MODE1, 0x00)
-        time.sleep(self.delay)
+        self.write(self.__MODE1, self.mode1)
+        self.phase_anchor = None        # the restart moved the phase
+        self.bus_frequency = freq
+        self.__set_period(prescale)
+        yield self.delay
 
         """self.write(self.__MODE1, oldmode)
         time.sleep(self.delay)
@@ -123,39 +495,280 @@ class PCA9685:
         """Update the pulse width on the specified channel."""
 
         # self.setServoPulse(channel, usec)
-        off: int = round(usec * (4096.0 / self.bus_period_usec))
-        chanx4: int = 4 * channel
-        try:
-            self.write(self.__LED0_ON_L  + chanx4, 0)
-            self.write(self.__LED0_ON_H  + chanx4, 0)
-            self.write(self.__LED0_OFF_L + chanx4, off & 0xFF)
-            self.write(self.__LED0_OFF_H + chanx4, off >> 8)
-        except:
-            print('WARNING, goto_usec() write failed')
+        self.goto_counts(channel, round(usec * (4096.0 / self.bus_period_usec)))
 
-    def goto_16_usec(self, usec_array: Sequence[float]) -> None:
-        """Update the pulse widths on up to 16 channels."""
-        #print('goto_16_usec', usec_array)
-        for chan_indx in self.active_channels:
+    def goto_counts(self, channel: int, off: int) -> None:
+        """Update the pulse width, in 12-bit counts, on the specified channel."""
 
-            off: int = round(usec_array[chan_indx] * (4096.0 / self.bus_period_usec))
+        # In atomic mode all four registers are written, OCH only changes
+        # the output once the last of them is loaded
+        self.__frame_error = None
+        self.__write_16([channel], [int(off)])
+        self.__raise_frame_error()
 
-            if self.last_off[chan_indx] == off:
-                continue
+    def goto_all_usec(self, usec: float) -> None:
+        """Send the same pulse width to all 16 channels in one transaction.
 
-            self.last_off[chan_indx] = off
-            chanx4: int = 4 * chan_indx
-            try:
-                if not self.on2zero[chan_indx]:
-                    self.write(self.__LED0_ON_L  + chanx4, 0)
-                    self.write(self.__LED0_ON_H  + chanx4, 0)
-                    self.on2zero[chan_indx] = True
-                self.write(self.__LED0_OFF_L + chanx4, off & 0xFF)
-                self.write(self.__LED0_OFF_H + chanx4, off >> 8)
-            except:
-                print('WARNING, goto_16_usec() write failed, retrying once...')
-                self.goto_usec(chan_indx, usec_array[chan_indx])
+        This uses the ALL_LED registers so inactive channels are set too.
+        """
+
+        self.goto_all_counts(round(usec * (4096.0 / self.bus_period_usec)))
 
+    def goto_all_counts(self, off: int) -> None:
+        """Send the same pulse width, in 12-bit counts, to all 16 channels."""
+
+        off = int(off)
+        if self.__write_all([0, 0, off & 0xFF, off >> 8]):
+            self.last_off[:] = off
+            self.off_unknown[:] = False
+            self.on2zero[:] = True
+
+    def all_full_off(self) -> None:
+        """Turn all 16 outputs fully off (no pulses) in one transaction, this relaxes the servos."""
+
+        if self.__write_all([0, 0, 0, self.__FULL]):
+            self.last_off[:] = 0
+            self.off_unknown[:] = True
+            self.on2zero[:] = True
+
+    def all_full_on(self) -> None:
+        """Turn all 16 outputs fully on in one transaction."""
+
+        # Full off wins over full on, so OFF_H is cleared in the same write
+        if self.__write_all([0, self.__FULL, 0, 0]):
+            self.last_off[:] = 0
+            self.off_unknown[:] = True
+            self.on2zero[:] = False
+
+    def __write_all(self, data: list[int]) -> bool:
+        """Write ALL_LED_ON_L..ALL_LED_OFF_H, returns False if the write failed."""
+
+        self.__frame_error = None
+        if self.block_write:
+            ok = self.__send_run(self.__ALLLED_ON_L, data)
+        else:
+            ok = all([self.__send_run(self.__ALLLED_ON_L + offset, [value])
+                      for offset, value in enumerate(data)])
+
+        if not ok:
+            # Some channels may have changed, make the next frame rewrite all of them
+            self.__invalidate(self.__LED0_ON_L, 64)
+            self.__raise_frame_error()
+            return False
+
+        # The chip copies ALL_LED to every LEDn, the ALL_LED registers read as zero
+        self.regs[self.__LED0_ON_L:self.__LED0_ON_L + 64] = data * 16
+        self.regs[self.__ALLLED_ON_L:self.__ALLLED_OFF_H + 1] = 0
+        return True
+
+    def goto_16_usec(self, usec_array: Sequence[float]) -> None:
+        """Update the pulse widths on up to 16 channels."""
+        #print('goto_16_usec', usec_array)
+        self.goto_16_counts(np.rint(np.asarray(usec_array) * (4096.0 / self.bus_period_usec)))
+
+    def goto_16_counts(self, counts: Sequence[int], channels: np.ndarray = None) -> None:
+        """Update the pulse widths, in 12-bit counts, on up to 16 channels.
+
+        channels, a mask of 16 bools, limits the frame to those channels, the
+        others are left as they are even if their last_off is not known.
+        """
+
+        self.__frame_error = None
+        if self.instrument is None:
+            moved = self.__goto_16(counts, channels)
+        else:
+            moved = self.__goto_16_instrumented(counts, channels)
+        if self.recorder is not None:
+            self.recorder.record_frame(counts, moved)
+        self.__raise_frame_error()
+
+    def __goto_16(self, counts: Sequence[int], channels: np.ndarray) -> np.ndarray:
+        """Write the channels that moved past their deadband, returns a mask of them."""
+
+        counts = np.asarray(counts)
+        moved = self.active_mask & ((np.abs(counts - self.last_off) > self.deadband) | self.off_unknown)
+        if channels is not None:
+            moved &= channels
+        dirty = np.flatnonzero(moved)
+        if len(dirty) == 0:
+            return moved
+
+        dirty_chans: list[int] = dirty.tolist()
+        dirty_offs:  list[int] = counts[dirty].astype(np.int32).tolist()
+
+        if self.frame_align:
+            self.__wait_for_window(max(max(dirty_offs), int(self.last_off[dirty].max())))
+            start = time.perf_counter()
+            self.__write_16(dirty_chans, dirty_offs)
+            # Smoothed write time, so the window leaves room for a typical frame
+            self.frame_write_time += 0.1 * (time.perf_counter() - start - self.frame_write_time)
+        else:
+            self.__write_16(dirty_chans, dirty_offs)
+
+        return moved
+
+    def __goto_16_instrumented(self, counts: Sequence[int], channels: np.ndarray) -> np.ndarray:
+        """__goto_16() with its time and bus counters recorded by the instrument."""
+
+        transactions  = self.transactions
+        bytes_written = self.bytes_written
+        retries       = self.retries
+
+        start = time.perf_counter()
+        moved = self.__goto_16(counts, channels)
+        seconds = time.perf_counter() - start
+
+        self.instrument.record_frame(seconds,
+                                     self.transactions - transactions,
+                                     self.bytes_written - bytes_written,
+                                     self.retries - retries,
+                                     int(np.count_nonzero(self.active_mask & ~moved)))
+        return moved
+
+    def __write_16(self, dirty_chans: list[int], dirty_offs: list[int]) -> None:
+        """Write the dirty channels."""
+
+        if self.atomic:
+            self.__write_whole_channels(dirty_chans, dirty_offs)
+        else:
+            self.__write_channels(dirty_chans, dirty_offs)
+
+    def __write_channels(self, chans: list[int], offs: list[int]) -> None:
+        """Write only the LEDn register bytes that differ from the register shadow.
+
+        Runs of changed bytes go out as one block write, a lone byte as a byte
+        write.  A gap of a few unchanged bytes is bridged, rewriting their
+        known values, when that is cheaper than starting another transaction.
+        """
+
+        base = self.__LED0_ON_L
+        shadow: list[int] = self.regs[base:base + 64].tolist()
+        changes: list[tuple[int, int]] = []     # (register, value) in register order
+        for chan_indx, off in zip(chans, offs):
+            indx = 4 * chan_indx
+            for value in (0, 0, off & 0xFF, off >> 8):
+                if shadow[indx] != value:
+                    changes.append((base + indx, value))
+                indx += 1
+
+        runs: list[tuple[int, list[int]]] = []
+        for reg, value in changes:
+            if runs:
+                run_reg, values = runs[-1]
+                run_end = run_reg + len(values)
+                gap = shadow[run_end - base:reg - base]
+                if (self.block_write and
+                        len(gap) <= self.__MAX_BRIDGE and
+                        len(values) + len(gap) < self.__BLOCK_MAX and
+                        -1 not in gap):
+                    values.extend(gap)
+                    values.append(value)
+                    continue
+            runs.append((reg, [value]))
+
+        failed: list[tuple[int, int]] = []
+        for run_reg, values in runs:
+            if not self.__send_run(run_reg, values):
+                failed.append((run_reg, len(values)))
+
+        self.last_off[chans] = offs
+        self.off_unknown[chans] = False
+        self.on2zero[chans] = True
+        for run_reg, length in failed:
+            self.__invalidate(run_reg, length)
+
+    def __write_whole_channels(self, chans: list[int], offs: list[int]) -> None:
+        """Write all four LEDn registers of each channel in one block, for atomic mode."""
+
+        # Merge neighbouring channels into runs, each run is written
+        # as one auto-increment block starting at its LEDn_ON_L.
+        runs: list[tuple[int, int]] = []      # (first index into chans, length)
+        prev_chan = -2
+        for indx, chan_indx in enumerate(chans):
+            if chan_indx == prev_chan + 1 and runs[-1][1] < self.__BLOCK_MAX_CHANNELS:
+                runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+            else:
+                runs.append((indx, 1))
+            prev_chan = chan_indx
+
+        for first, length in runs:
+            data: list[int] = []
+            for off in offs[first:first + length]:
+                data += [0, 0, off & 0xFF, off >> 8]
+            run_reg = self.__LED0_ON_L + 4 * chans[first]
+            if self.__send_run(run_reg, data):
+                self.last_off[chans[first]:chans[first] + length] = offs[first:first + length]
+                self.off_unknown[chans[first]:chans[first] + length] = False
+                self.on2zero[chans[first]:chans[first] + length] = True
+            else:
+                self.__invalidate(run_reg, len(data))
+
+    def __send_run(self, reg: int, values: list[int]) -> bool:
+        """Write a run of registers in one transaction, returns False if it failed.
+
+        Transient errors are retried as set by the retry policy.
+        """
+
+        policy = self.retry
+        backoff = policy.backoff_usec / 1000000.0
+        attempt = 1
+        while True:
+            try:
+                self.__send(reg, values)
+                return True
+            except OSError as error:
+                failure = error
+                self.write_errors += 1
+                self.last_error = error
+                # A partly written run leaves the registers unknown
+                self.regs[reg:reg + len(values)] = -1
+                if error.errno not in policy.transient_errnos or attempt >= policy.max_attempts:
+                    break
+
+            log.debug('write to register 0x%02x failed, retry %d', reg, attempt)
+            self.retries += 1
+            attempt += 1
+            if backoff > 0.0:
+                self.__sleep(backoff)
+                backoff *= policy.backoff_factor
+
+        self.write_failures += 1
+        if self.__frame_error is None:
+            self.__frame_error = failure
+        log.warning('write to register 0x%02x failed after %d tries: %s', reg, attempt, failure)
+        return False
+
+    def __raise_frame_error(self) -> None:
+        """Raise the first error of the frame, if the retry policy wants that."""
+
+        if self.__frame_error is not None and self.retry.raise_on_failure:
+            error = self.__frame_error
+            self.__frame_error = None
+            raise error
+
+    def error_counts(self) -> dict:
+        """The write error counters."""
+
+        return {'errors':   self.write_errors,
+                'retries':  self.retries,
+                'failures': self.write_failures}
+
+    def __invalidate(self, reg: int, length: int) -> None:
+        """Mark a run of LEDn registers, and their channels, as unknown so the next frame rewrites them."""
+
+        self.regs[reg:reg + length] = -1
+        first_chan = (reg - self.__LED0_ON_L) // 4
+        last_chan  = (reg + length - 1 - self.__LED0_ON_L) // 4
+        self.off_unknown[first_chan:last_chan + 1] = True
+        self.on2zero[first_chan:last_chan + 1] = False
+
+    def __send(self, reg: int, values: list[int]) -> None:
+        """One transaction, a byte write for a single value else a block write."""
+
+        if len(values) == 1:
+            self.write(reg, values[0])
+        else:
+            self.write_block(reg, values)
 
 
 def __test_pca() -> None:
@@ -0,0 +1,33 @@
+"""The binary protocol between the bus-owner daemon and its clients
+
+Messages go over a SOCK_SEQPACKET Unix domain socket, so every send() is
+one whole message.  A message is a HEADER (type, flags, count) followed by
+a body that depends on the type.  Everything is little-endian.
+
+Moves get no reply.  INFO, RADIAN_TO_USEC and USEC_TO_RADIAN are answered
+with a message of the same type.
+"""
+
+import struct
+
+DEFAULT_SOCKET = '/tmp/pca9685_psd.sock'
+
+# The longest message either side sends, 64 boards of channel values
+MAX_MESSAGE = 8192
+
+HEADER        = struct.Struct('<BBH')     # type, flags, count
+CHANNEL_VALUE = struct.Struct('<Hf')      # channel, radians or usec
+INFO_REPLY    = struct.Struct('<Hd')      # number of channels, frame rate in Hz
+CONVERT       = struct.Struct('<Hd')      # channel, radians or usec
+VALUE         = struct.Struct('<d')       # the converted value
+
+# Message types
+MOVE_ALL       = 1      # count float32 radians, for channels 0 .. count-1
+MOVE_CHANNELS  = 2      # count CHANNEL_VALUEs in radians
+MOVE_USEC      = 3      # count CHANNEL_VALUEs in usec, never limited
+INFO           = 4      # no body, the reply body is INFO_REPLY
+RADIAN_TO_USEC = 5      # body CONVERT, the reply body is VALUE
+USEC_TO_RADIAN = 6      # body CONVERT, the reply body is VALUE
+
+# Flags
+NOLIMIT = 0x01          # do not apply the calibration limits to a move
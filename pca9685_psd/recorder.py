@@ -0,0 +1,90 @@
+"""Record the frames sent to a PCA9685 in a fixed size ring buffer
+
+A Recorder passed to Servo or PCA9685 keeps the last size frames: when
+each was written, the radians asked for, the 12-bit counts after the
+calibration and limits, and which channels were actually written.  All
+of the buffers are allocated up front, so recording a frame only copies
+into them.  dump() saves the buffer to a file for later study.
+"""
+
+import contextlib
+import time
+
+from collections.abc import Iterator
+
+import numpy as np
+
+
+class Recorder:
+    """A ring buffer of the last size frames written.
+
+    Frames with no radians, such as goto_16_usec() calls, record NaN.
+    In threaded mode the radians are those of the latest move made before
+    the frame was written.
+    """
+
+    def __init__(self, size: int = 4096, num_channels: int = 16):
+
+        self.size = size
+        self.time    = np.zeros(size)
+        self.radians = np.full((size, num_channels), np.nan, dtype=np.float32)
+        self.counts  = np.zeros((size, num_channels), dtype=np.int16)
+        self.written = np.zeros((size, num_channels), dtype=bool)
+
+        self.num_frames = 0         # frames recorded since the start, not just those held
+        self.__have_radians = False
+
+    def __len__(self) -> int:
+        return min(self.num_frames, self.size)
+
+    def record_radians(self, radians) -> None:
+        """Record the radians of the next frame."""
+
+        self.radians[self.num_frames % self.size] = radians
+        self.__have_radians = True
+
+    def record_frame(self, counts, written) -> None:
+        """Record a frame, counts for all channels and a mask of the channels written."""
+
+        indx = self.num_frames % self.size
+        self.time[indx] = time.time()
+        self.counts[indx] = counts
+        self.written[indx] = written
+        if not self.__have_radians:
+            self.radians[indx] = np.nan
+        self.__have_radians = False
+        self.num_frames += 1
+
+    def frames(self) -> dict:
+        """Copies of the frames held, oldest first."""
+
+        held = len(self)
+        order = (np.arange(self.num_frames - held, self.num_frames)) % self.size
+        return {'time':    self.time[order],
+                'radians': self.radians[order],
+                'counts':  self.counts[order],
+                'written': self.written[order]}
+
+    def dump(self, path: str) -> None:
+        """Save the frames held to a compressed .npz file, read it back with Recorder.load()."""
+
+        np.savez_compressed(path, num_frames=np.array(self.num_frames), **self.frames())
+
+    @contextlib.contextmanager
+    def dump_on_error(self, path: str) -> Iterator['Recorder']:
+        """Dump the frames if the with block raises, the exception is not swallowed."""
+
+        try:
+            yield self
+        except BaseException:
+            self.dump(path)
+            raise
+
+    @staticmethod
+    def load(path: str) -> dict:
+        """Read a dump, a dict of time, radians, counts, written and num_frames."""
+
+        with np.load(path, allow_pickle=False) as data:
+            frames = {name: data[name] for name in data.files}
+        frames['num_frames'] = int(frames['num_frames'])
+        return frames
@@ -1,11 +1,373 @@
 """control a set of hobby servos using PCA9685"""
 
+import hashlib
 import logging
 import math
+import os
+import tempfile
+import time
 
-import yaml
 import numpy as np
+from .instrument import Instrument
+from .output_thread import OutputThread
 from .pca9685 import PCA9685
+from .recorder import Recorder
+from .transport import Transport, SimulatedTransport
+from .upsample import Upsampler
+
+
+# Calibration fits, the usec pulse width as a function of the angle in radians.
+# linear uses slope and intercept, poly the coefficients (highest power
+# first, as for np.polyval) and piecewise joins the calibration points with
+# straight lines.  Poly and piecewise fits are extended past the first and
+# last calibration points by straight lines with the slope at the end.
+CAL_FITS = ('linear', 'poly', 'piecewise')
+
+# Samples per channel in a calibration lookup table
+LUT_SIZE = 1024
+
+# Bump this when the calibration cache layout changes, old caches are rebuilt
+CAL_CACHE_VERSION = 2
+
+_log = logging.getLogger(__name__)
+
+
+def load_calibration(cal_file: str, num_channels: int = 16, cache: bool | str = True) -> dict:
+	"""Read channels 0 .. num_channels-1 of a calibration file into arrays.
+
+	'lut' is a CalibrationLUT in usec if any fit is not linear, else None.
+	'frequency' and 'clock_correction' are the file's 'pwm frequency' and
+	'clock correction', or None if it does not set them.
+
+	Parsing the YAML is slow on a small board, so the arrays are kept in a
+	compiled .npz cache next to the calibration file (servo_cal.16.npz for
+	servo_cal.yaml), or at the path given by cache.  The cache is keyed by a hash of the file contents and is
+	rebuilt when the file changes.  cache=False reads the YAML every time.
+	"""
+
+	with open(cal_file, mode="rb") as cfile:
+		contents = cfile.read()
+
+	if cache is False:
+		return _parse_calibration(contents, num_channels)
+
+	if cache is True:
+		cache = '%s.%d.npz' % (os.path.splitext(cal_file)[0], num_channels)
+	key = '%d:%d:%s' % (CAL_CACHE_VERSION, num_channels, hashlib.sha256(contents).hexdigest())
+
+	cal = _read_cal_cache(cache, key)
+	if cal is None:
+		cal = _parse_calibration(contents, num_channels)
+		_write_cal_cache(cache, key, cal)
+	return cal
+
+
+def _parse_calibration(contents: bytes, num_channels: int) -> dict:
+	"""Build the calibration arrays from the YAML text."""
+
+	names            = []
+	slope_list       = []
+	intercept_list   = []
+	lower_limit_list = []
+	upper_limit_list = []
+	active_list      = []
+	fit_list         = []
+
+	# Only needed when there is no valid cache
+	import yaml
+
+	cal_data = yaml.safe_load(contents.decode('utf-8'))
+
+	for chan in range(num_channels):
+		names.append(cal_data[chan]['name'])
+		slope_list.append(cal_data[chan]['slope'])
+		intercept_list.append(cal_data[chan]['intercept'])
+		lower_limit_list.append(cal_data[chan]['usec lower limit'])
+		upper_limit_list.append(cal_data[chan]['usec upper limit'])
+		active_list.append(bool(cal_data[chan]['active']))
+
+		fit = cal_data[chan].get('fit', 'linear')
+		if fit not in CAL_FITS:
+			raise ValueError('unknown calibration fit for channel %d: %s' % (chan, fit))
+		fit_list.append(fit)
+
+	lut = None
+	if any(fit != 'linear' for fit in fit_list):
+		lut = CalibrationLUT.from_fits([cal_data[chan] for chan in range(num_channels)])
+
+	return {'names':       names,
+			'slope':       np.array(slope_list),
+			'intercept':   np.array(intercept_list),
+			'lower_limit': np.array(lower_limit_list),
+			'upper_limit': np.array(upper_limit_list),
+			'active':      np.array(active_list),
+			'fit':         fit_list,
+			'lut':         lut,
+			'frequency':        cal_data.get('pwm frequency'),
+			'clock_correction': cal_data.get('clock correction')}
+
+
+def _read_cal_cache(path: str, key: str) -> dict:
+	"""The calibration arrays from a cache file, None if it is missing, unreadable or stale."""
+
+	try:
+		with np.load(path, allow_pickle=False) as data:
+			if str(data['key']) != key:
+				return None
+			lut = None
+			if data['lut_table'].size:
+				lut = CalibrationLUT(data['lut_start'], data['lut_step'], data['lut_table'])
+			return {'names':       data['names'].tolist(),
+					'slope':       data['slope'],
+					'intercept':   data['intercept'],
+					'lower_limit': data['lower_limit'],
+					'upper_limit': data['upper_limit'],
+					'active':      data['active'],
+					'fit':         data['fit'].tolist(),
+					'lut':         lut,
+					'frequency':        _none_if_nan(data['frequency']),
+					'clock_correction': _none_if_nan(data['clock_correction'])}
+	except Exception as error:
+		# A cache cut short by a power loss, or garbage, only costs a YAML parse
+		_log.debug('calibration cache %s not used: %s', path, error)
+		return None
+
+
+def _none_if_nan(value: np.ndarray) -> float:
+	value = float(value)
+	return None if math.isnan(value) else value
+
+
+def _write_cal_cache(path: str, key: str, cal: dict) -> None:
+	"""Write the calibration cache, a failure only costs the next start a YAML parse."""
+
+	lut = cal['lut']
+	empty = np.zeros(0)
+	try:
+		# Write a temporary file then rename it, so a reader never sees half a cache
+		fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(path)))
+		try:
+			with os.fdopen(fd, 'wb') as tmp_file:
+				np.savez(tmp_file,
+						 key=np.array(key),
+						 names=np.array(cal['names'], dtype=str),
+						 slope=cal['slope'],
+						 intercept=cal['intercept'],
+						 lower_limit=cal['lower_limit'],
+						 upper_limit=cal['upper_limit'],
+						 active=cal['active'],
+						 fit=np.array(cal['fit'], dtype=str),
+						 lut_start=empty if lut is None else lut.start,
+						 lut_step=empty if lut is None else lut.step,
+						 lut_table=empty if lut is None else lut.table,
+						 frequency=np.array(np.nan if cal['frequency'] is None else cal['frequency']),
+						 clock_correction=np.array(np.nan if cal['clock_correction'] is None
+												   else cal['clock_correction']))
+				# On disk before the rename, else a power loss can leave an empty cache
+				tmp_file.flush()
+				os.fsync(tmp_file.fileno())
+			os.replace(tmp_path, path)
+		except BaseException:
+			os.unlink(tmp_path)
+			raise
+	except OSError as error:
+		_log.debug('calibration cache %s not written: %s', path, error)
+
+
+def fit_domain(channel: dict) -> tuple[float, float]:
+	"""The angles, in radians, between which a channel's fit is used as is."""
+
+	points = channel.get('points') or []
+	if len(points) < 2:
+		return -math.pi, math.pi
+	angles = [float(point[1]) for point in points]
+	return min(angles), max(angles)
+
+
+def fit_usec(channel: dict, radians) -> np.ndarray:
+	"""Evaluate a channel's calibration fit, channel is its calibration file entry."""
+
+	radians = np.asarray(radians, dtype=float)
+	fit = channel.get('fit', 'linear')
+	if fit == 'linear':
+		return channel['slope'] * radians + channel['intercept']
+
+	if fit == 'piecewise':
+		points = np.array(sorted(channel['points'], key=lambda point: point[1]), dtype=float)
+		angles, usecs = points[:, 1], points[:, 0]
+		def curve(x):
+			return np.interp(x, angles, usecs)
+	else:
+		coefficients = np.asarray(channel['coefficients'], dtype=float)
+		def curve(x):
+			return np.polyval(coefficients, x)
+
+	# Past the ends, a straight line with the slope at the end
+	lo, hi = fit_domain(channel)
+	eps = 1e-6 * (hi - lo)
+	lo_slope = (curve(lo + eps) - curve(lo)) / eps
+	hi_slope = (curve(hi) - curve(hi - eps)) / eps
+	inside = np.clip(radians, lo, hi)
+	return (curve(inside) +
+			np.minimum(radians - lo, 0.0) * lo_slope +
+			np.maximum(radians - hi, 0.0) * hi_slope)
+
+
+class CalibrationLUT:
+	"""Calibration fits sampled on an even grid of angles, one row per channel.
+
+	A lookup is a linear interpolation in every channel's table at once, so
+	a nonlinear calibration costs about the same as a linear one.  Past the
+	ends of a table the first and last segments are extended.
+	"""
+
+	def __init__(self, start: np.ndarray, step: np.ndarray, table: np.ndarray):
+
+		self.start = start
+		self.step  = step
+		self.table = table
+
+		self.inv_step = 1.0 / self.step
+		self.delta    = np.diff(self.table, axis=1)
+		self.rows     = np.arange(len(table))
+		self.last     = table.shape[1] - 2
+
+	@classmethod
+	def from_fits(cls, channels: list[dict], size: int = LUT_SIZE) -> 'CalibrationLUT':
+		"""Sample the fits of calibration file entries, in usec."""
+
+		num_channels = len(channels)
+		start = np.zeros(num_channels)
+		step  = np.ones(num_channels)
+		table = np.zeros((num_channels, size))
+
+		grid = np.linspace(0.0, 1.0, size)
+		for chan, channel in enumerate(channels):
+			lo, hi = fit_domain(channel)
+			start[chan] = lo
+			step[chan]  = (hi - lo) / (size - 1)
+			table[chan] = fit_usec(channel, lo + (hi - lo) * grid)
+
+		return cls(start, step, table)
+
+	def scaled(self, scale: float) -> 'CalibrationLUT':
+		"""A copy with every value multiplied by scale, usec_to_count gives a table in counts."""
+
+		return CalibrationLUT(self.start, self.step, self.table * scale)
+
+	def lookup(self, radians) -> np.ndarray:
+		"""Values for angles in radians on all channels, radians may also be frames x channels."""
+
+		pos = (radians - self.start) * self.inv_step
+		indx = np.clip(pos, 0, self.last).astype(np.intp)
+		return self.table[self.rows, indx] + (pos - indx) * self.delta[self.rows, indx]
+
+	def lookup_channel(self, chan: int, radian: float) -> float:
+		"""The value for one angle on one channel."""
+
+		pos = (radian - self.start[chan]) * self.inv_step[chan]
+		indx = min(max(int(pos), 0), self.last)
+		return float(self.table[chan, indx] + (pos - indx) * self.delta[chan, indx])
+
+	def inverse(self, chan: int, value: float) -> float:
+		"""The angle that gives a value on one channel, the fit must be monotonic."""
+
+		row = self.table[chan]
+		angles = self.start[chan] + self.step[chan] * np.arange(len(row))
+		if row[-1] < row[0]:
+			row, angles = row[::-1], angles[::-1]
+
+		# Past the ends, invert the extended end segments
+		if value < row[0]:
+			return float(angles[0] + (value - row[0]) * (angles[1] - angles[0]) / (row[1] - row[0]))
+		if value > row[-1]:
+			return float(angles[-1] + (value - row[-1]) * (angles[-1] - angles[-2]) / (row[-1] - row[-2]))
+		return float(np.interp(value, row, angles))
+
+
+def pwm_settings(cal: dict, bus_frequency: float = None, clock_correction: float = None) -> tuple[float, float]:
+	"""The PWM frequency and clock correction, from the arguments, else the calibration file, else the old defaults."""
+
+	if bus_frequency is None:
+		bus_frequency = cal['frequency'] if cal['frequency'] is not None else 60.0
+	if clock_correction is None:
+		clock_correction = cal['clock_correction'] if cal['clock_correction'] is not None else 0.920
+	return bus_frequency, clock_correction
+
+
+class CountCalibration:
+	"""A calibration from load_calibration() folded into 12-bit PWM counts.
+
+	bus_period_usec is the PWM period the chip really runs at.  A move is
+	then a multiply-add, a clip and a round on the whole array, and the
+	PCA9685 takes the counts with no per channel conversion.  A poly or
+	piecewise fit on any channel puts all of them through a lookup table.
+	Servo and ServoArray both convert through this.
+	"""
+
+	def __init__(self, cal: dict, bus_period_usec: float):
+
+		self.names       = cal['names']
+		self.slope       = cal['slope']
+		self.intercept   = cal['intercept']
+		self.lower_limit = cal['lower_limit']
+		self.upper_limit = cal['upper_limit']
+		self.fit         = cal['fit']
+
+		self.usec_to_count   = 4096.0 / bus_period_usec
+		self.count_slope     = self.slope       * self.usec_to_count
+		self.count_intercept = self.intercept   * self.usec_to_count
+		self.count_lower     = self.lower_limit * self.usec_to_count
+		self.count_upper     = self.upper_limit * self.usec_to_count
+
+		self.lut = None
+		if cal['lut'] is not None:
+			self.lut = cal['lut'].scaled(self.usec_to_count)
+
+	def counts(self, radians) -> np.ndarray:
+		"""Angles in radians for every channel to counts, with no limits or rounding.
+
+		radians may also be frames x channels.
+		"""
+
+		if self.lut is None:
+			return (self.count_slope * radians) + self.count_intercept
+		return self.lut.lookup(radians)
+
+	def count(self, chan: int, radian: float) -> float:
+		"""An angle in radians on one channel to counts, with no limits or rounding."""
+
+		if self.lut is None:
+			return (self.count_slope[chan] * radian) + self.count_intercept[chan]
+		return self.lut.lookup_channel(chan, radian)
+
+	def radians_to_counts(self, radians, limit: bool = True) -> np.ndarray:
+		"""Angles in radians for every channel to rounded counts, limited unless limit is False."""
+
+		counts = self.counts(radians)
+		if limit:
+			np.clip(counts, self.count_lower, self.count_upper, out=counts)
+		return np.rint(counts).astype(np.int16)
+
+	def radian_to_count(self, chan: int, radian: float, limit: bool = True) -> int:
+		"""An angle in radians on one channel to rounded counts, limited unless limit is False."""
+
+		count = self.count(chan, radian)
+		if limit:
+			count = min(max(count, self.count_lower[chan]), self.count_upper[chan])
+		return round(count)
+
+	def radian_to_usec(self, chan: int, radian: float) -> float:
+
+		if self.lut is not None:
+			return self.lut.lookup_channel(chan, radian) / self.usec_to_count
+		return (self.slope[chan] * radian) + self.intercept[chan]
+
+	def usec_to_radian(self, chan: int, usec: float) -> float:
+
+		if self.lut is not None:
+			return self.lut.inverse(chan, usec * self.usec_to_count)
+		return (usec - self.intercept[chan]) / self.slope[chan]
 
 
 class Servo:
@@ -14,86 +376,186 @@ class Servo:
 	def __init__(self,
                  smbus_number: int = 1,
 				 log: bool = False,
-				 noi2c: bool = False):
+				 noi2c: bool = False,
+				 transport: Transport = None,
+				 cal_file: str = 'servo_cal.yaml',
+				 cal_cache: bool | str = True,
+				 threaded: bool = False,
+				 init_device: bool = True,
+				 attach: bool = False,
+				 instrument: Instrument = None,
+				 recorder: Recorder = None,
+				 upsample: str = None,
+				 max_velocity=np.inf,
+				 max_acceleration=np.inf,
+				 bus_frequency: float = None,
+				 clock_correction: float = None):
 
 		self.log = log
 
-		names            = []
-		slope_list       = []
-		intercept_list   = []
-		lower_limit_list = []
-		upper_limit_list = []
+		# Conversion times and radians are recorded here, frames by the PCA9685
+		self.instrument = instrument
+		self.recorder = recorder
 
-		with open('servo_cal.yaml', mode="rt", encoding="utf-8") as cal_file:
-			cal_data = yaml.safe_load(cal_file)
-
-		for chan in cal_data:
-			names.append(cal_data[chan]['name'])
-			slope_list.append(cal_data[chan]['slope'])
-			intercept_list.append(cal_data[chan]['intercept'])
-			lower_limit_list.append(cal_data[chan]['usec lower limit'])
-			upper_limit_list.append(cal_data[chan]['usec upper limit'])
-
-		self.names       = names
-		self.slope       = np.array(slope_list)
-		self.intercept   = np.array(intercept_list)
-		self.lower_limit = np.array(lower_limit_list)
-		self.upper_limit = np.array(upper_limit_list)
+		cal = load_calibration(cal_file, 16, cal_cache)
 
 		# This is a list of the active channel numbers
-		active_list = []
-		for ch_indx in range(16):
-			if cal_data[chan]['active']:
-				active_list.append(ch_indx)
-
-		if not noi2c:
-			self.pca = PCA9685(
-							smbus_number=smbus_number,
-							bus_frequency=60.0,
-							active_channels=active_list,
-							clock_correction=0.920)  # FIXME should not be a constant
+		active_list = [int(ch_indx) for ch_indx in np.flatnonzero(cal['active'])]
+
+		# Digital servos take 200 to 330 Hz, which cuts the time from a
+		# command to the motion.
+		bus_frequency, clock_correction = pwm_settings(cal, bus_frequency, clock_correction)
+
+		# With noi2c the servos drive a simulated chip, nothing goes on the bus
+		if noi2c and transport is None:
+			transport = SimulatedTransport()
+
+		self.pca = PCA9685(
+						smbus_number=smbus_number,
+						bus_frequency=bus_frequency,
+						active_channels=active_list,
+						clock_correction=clock_correction,
+						transport=transport,
+						init_device=init_device,
+						attach=attach,
+						instrument=instrument,
+						recorder=recorder)
+
+		# Fold the calibration into 12-bit PWM counts once
+		self.calibration = CountCalibration(cal, self.pca.bus_period_usec)
+		self.names       = self.calibration.names
+		self.slope       = self.calibration.slope
+		self.intercept   = self.calibration.intercept
+		self.lower_limit = self.calibration.lower_limit
+		self.upper_limit = self.calibration.upper_limit
+
+		# In threaded mode the moves only queue a frame and return, a
+		# background thread writes the newest frame once per PWM period.
+		# With upsample, Upsampler.LINEAR or LIMITED, the moves are setpoints
+		# and the thread writes frames interpolated between them, so the
+		# control loop can run slower than the PWM rate.  max_velocity, in
+		# radians per second, and max_acceleration, in radians per second
+		# squared, are the LIMITED limits, one value or one per channel.
+		self.output = None
+		self.upsampler = None
+		self.__send_16 = self.pca.goto_16_counts
+		self.__send_1  = self.pca.goto_counts
+		if upsample is not None:
+			counts_per_radian = np.abs(self.calibration.count_slope)
+			with np.errstate(invalid='ignore'):
+				max_velocity     = np.nan_to_num(counts_per_radian * max_velocity, nan=np.inf)
+				max_acceleration = np.nan_to_num(counts_per_radian * max_acceleration, nan=np.inf)
+			# Seeded from the chip like OutputThread, so a channel with no setpoint holds still
+			self.upsampler = Upsampler(upsample, max_velocity, max_acceleration,
+									   initial=self.pca.last_off, known=~self.pca.off_unknown)
+			self.output = OutputThread(self.pca, frame_source=self.upsampler.frame)
+			self.__send_16 = self.upsampler.set_frame
+			self.__send_1  = self.upsampler.set_channel
+			self.output.start()
+		elif threaded:
+			self.output = OutputThread(self.pca)
+			self.__send_16 = self.output.submit
+			self.__send_1  = self.output.submit_channel
+			self.output.start()
+
+	def close(self) -> None:
+		"""Stop the output thread, if running."""
+
+		if self.output is not None:
+			self.output.stop()
+
+	def radians_to_counts(self, radians) -> np.ndarray:
+		"""Convert angles in radians for all 16 channels to limited 12-bit counts.
+
+		radians may also be frames x 16, every frame is converted.
+		"""
+
+		return self.calibration.radians_to_counts(radians)
 
 	def move_16_radian(self, radians):
 		"""Move all active servos to angles expressed in radians."""
 
-		usecs = (self.slope * radians) + self.intercept
-		usecs_clipped = np.fmin(np.fmax(usecs, self.lower_limit), self.upper_limit)
+		if self.recorder is not None:
+			self.recorder.record_radians(radians)
+		if self.instrument is None:
+			self.__send_16(self.radians_to_counts(radians))
+			return
+
+		start = time.perf_counter()
+		counts = self.radians_to_counts(radians)
+		self.instrument.record_convert(time.perf_counter() - start)
+		self.__send_16(counts)
+
+	def setpoint_16_radian(self, radians, timestamp: float = None):
+		"""Set where all servos should be, in radians, at time timestamp.
+
+		timestamp is a time.perf_counter() value, the default is now.  With
+		upsampling the output moves smoothly to the setpoint, else this is
+		move_16_radian() and the time stamp is not used.
+		"""
 
-		self.pca.goto_16_usec(usecs_clipped)
+		if self.upsampler is None:
+			self.move_16_radian(radians)
+			return
+
+		if self.recorder is not None:
+			self.recorder.record_radians(radians)
+		self.upsampler.set_frame(self.radians_to_counts(radians), timestamp)
 
 	def move_16_radian_nolimit(self, radians):
 		"""Move all active servos to angles expressed in radians, with no limit checks."""
 
-		usecs = (self.slope * radians) + self.intercept
-		self.pca.goto_16_usec(usecs)
+		if self.recorder is not None:
+			self.recorder.record_radians(radians)
+		if self.instrument is not None:
+			start = time.perf_counter()
+		counts = self.calibration.radians_to_counts(radians, limit=False)
+		if self.instrument is not None:
+			self.instrument.record_convert(time.perf_counter() - start)
+		self.__send_16(counts)
+
+	def move_16_counts(self, counts, channels=None):
+		"""Move servos to pulse widths in 12-bit counts, with no calibration or limit checks.
+
+		channels, a mask of 16 bools, limits the move to those channels.  As
+		for the other moves, in threaded or upsample mode the output thread
+		writes the counts.
+		"""
+
+		self.__send_16(counts, channels=channels)
 
 	def move_radian(self, channel_number, radian):
 		"""Move a servo to an angle expressed in radians."""
 
-		usec = (self.slope[channel_number] * radian) + self.intercept[channel_number]
-		usec_clipped = min(max(usec, self.lower_limit[channel_number]), self.upper_limit[channel_number])
-		self.pca.goto_usec(channel_number, usec_clipped)
+		self.__send_1(channel_number, self.calibration.radian_to_count(channel_number, radian))
 
 	def move_radian_nolimit(self, channel_number, radian):
 		"""Move a servo to an angle expressed in radians, with no limit checks."""
 
-		usec = (self.slope[channel_number] * radian) + self.intercept[channel_number]
-		self.pca.goto_usec(channel_number, usec)
+		self.__send_1(channel_number, self.calibration.radian_to_count(channel_number, radian, limit=False))
 
 	def move_usec(self, channel_number, usec):
 		"""Move a servo to an angle expressed in microseconds, with no limit checks."""
 
-		self.pca.goto_usec(channel_number, usec)
+		self.__send_1(channel_number, round(usec * self.calibration.usec_to_count))
 
-	def radian_to_usec(self, channel_number, radian) -> float:
+	def play_clip(self, path: str, frame_rate: float = None, loops: int = 1) -> None:
+		"""Play a motion clip, a frames x 16 .npy file of radians or counts, see Clip.
 
-		usec = (self.slope[channel_number] * radian) + self.intercept[channel_number]
-		return usec
+		The default frame rate is the PWM frame rate.
+		"""
 
-	def usec_to_radian(self, channel_number, usec) -> float:
+		from .trajectory import Clip
+
+		if frame_rate is None:
+			frame_rate = 1.0 / self.pca.pwm_period
+		Clip(path, frame_rate, self).play(loops=loops)
 
-		radian =(usec - self.intercept[channel_number]) / self.slope[channel_number]
-		return radian
+	def radian_to_usec(self, channel_number, radian) -> float:
+		return self.calibration.radian_to_usec(channel_number, radian)
+
+	def usec_to_radian(self, channel_number, usec) -> float:
+		return self.calibration.usec_to_radian(channel_number, usec)
 
 
 if __name__ == '__main__':
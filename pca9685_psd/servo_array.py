@@ -0,0 +1,165 @@
+"""control servos spread over several PCA9685 boards"""
+
+import numpy as np
+
+from .dispatch import BusDispatcher
+from .pca9685 import PCA9685
+from .servo import CountCalibration, load_calibration, pwm_settings
+from .transport import Transport, SMBusTransport, SimulatedTransport
+
+
+class ServoArray:
+    """Control 16 servos per board on several PCA9685 boards.
+
+    Servos are numbered globally, channel g is channel g % 16 on board g // 16,
+    where the boards are in the order of the addresses list.  The calibration
+    file holds entries 0 .. 16*N-1 in the same format as for Servo.
+
+    By default all boards share bus smbus_number.  smbus_numbers gives the bus
+    of each board instead, boards on different buses are written in parallel.
+    """
+
+    def __init__(self,
+                 addresses: list[int] = [0x40, 0x41],
+                 smbus_number: int = 1,
+                 smbus_numbers: list[int] = None,
+                 log: bool = False,
+                 noi2c: bool = False,
+                 transport: Transport = None,
+                 cal_file: str = 'servo_cal.yaml',
+                 cal_cache: bool | str = True,
+                 attach: bool = False,
+                 bus_frequency: float = None,
+                 clock_correction: float = None):
+
+        self.log = log
+        self.addresses = list(addresses)
+        self.num_boards = len(self.addresses)
+        self.num_channels = 16 * self.num_boards
+
+        cal = load_calibration(cal_file, self.num_channels, cal_cache)
+        bus_frequency, clock_correction = pwm_settings(cal, bus_frequency, clock_correction)
+
+        if smbus_numbers is None:
+            smbus_numbers = [smbus_number for address in self.addresses]
+        if len(smbus_numbers) != self.num_boards:
+            raise ValueError('smbus_numbers needs one bus number per address')
+        self.smbus_numbers = list(smbus_numbers)
+
+        # All boards on a bus share one transport
+        self.transports: dict[int, Transport] = {}
+        for bus_number in self.smbus_numbers:
+            if bus_number in self.transports:
+                continue
+            if transport is not None:
+                self.transports[bus_number] = transport
+            elif noi2c:
+                self.transports[bus_number] = SimulatedTransport()
+            else:
+                self.transports[bus_number] = SMBusTransport(bus_number)
+
+        active = cal['active'].reshape(self.num_boards, 16)
+        self.pcas: list[PCA9685] = []
+        for board, address in enumerate(self.addresses):
+            bus_number = self.smbus_numbers[board]
+            self.pcas.append(PCA9685(
+                                smbus_number=bus_number,
+                                address=address,
+                                bus_frequency=bus_frequency,
+                                active_channels=[int(c) for c in np.flatnonzero(active[board])],
+                                clock_correction=clock_correction,
+                                transport=self.transports[bus_number],
+                                attach=attach))
+
+        self.calibration = CountCalibration(cal, self.pcas[0].bus_period_usec)
+        self.names       = self.calibration.names
+        self.slope       = self.calibration.slope
+        self.intercept   = self.calibration.intercept
+        self.lower_limit = self.calibration.lower_limit
+        self.upper_limit = self.calibration.upper_limit
+
+        # Only worth a thread per bus when there is more than one bus
+        self.dispatcher = None
+        if len(set(id(t) for t in self.transports.values())) > 1:
+            self.dispatcher = BusDispatcher(self.pcas)
+
+    def close(self) -> None:
+        """Stop the bus worker threads, if any."""
+
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+            self.dispatcher = None
+
+    def board_channel(self, channel_number: int) -> tuple[int, int]:
+        """Map a global channel number to (board index, channel on that board)."""
+
+        return divmod(channel_number, 16)
+
+    def radians_to_counts(self, radians, limit: bool = True) -> np.ndarray:
+        """Convert angles in radians for all 16*N channels to 12-bit counts, limited unless limit is False."""
+
+        return self.calibration.radians_to_counts(np.ravel(radians), limit)
+
+    def radian_to_count(self, channel_number: int, radian: float, limit: bool = True) -> int:
+        """Convert an angle in radians on one channel to 12-bit counts, limited unless limit is False."""
+
+        return self.calibration.radian_to_count(channel_number, radian, limit)
+
+    def move_all_radian(self, radians) -> None:
+        """Move all active servos on all boards to angles expressed in radians.
+
+        radians may be flat with 16*N elements or shaped N x 16.
+        """
+
+        self.__send(self.radians_to_counts(radians))
+
+    def move_all_radian_nolimit(self, radians) -> None:
+        """Move all active servos on all boards to angles in radians, with no limit checks."""
+
+        self.__send(self.radians_to_counts(radians, limit=False))
+
+    def move_all_counts(self, counts, channels=None) -> None:
+        """Send pulse widths in 12-bit counts to all 16*N channels, flat or shaped N x 16.
+
+        channels, a mask shaped as counts, limits the frames to those channels.
+        """
+
+        self.__send(np.asarray(counts), channels)
+
+    def __send(self, counts: np.ndarray, channels=None) -> None:
+        """Send one 16 channel frame to each board."""
+
+        frames = counts.reshape(self.num_boards, 16)
+        if channels is None:
+            masks = [None] * self.num_boards
+        else:
+            masks = np.reshape(channels, (self.num_boards, 16))
+        if self.dispatcher is not None:
+            self.dispatcher.goto_16_counts(frames, masks)
+            return
+        for pca, frame, mask in zip(self.pcas, frames, masks):
+            pca.goto_16_counts(frame, mask)
+
+    def move_radian(self, channel_number: int, radian: float) -> None:
+        """Move a servo to an angle expressed in radians."""
+
+        board, chan = divmod(channel_number, 16)
+        self.pcas[board].goto_counts(chan, self.radian_to_count(channel_number, radian))
+
+    def move_radian_nolimit(self, channel_number: int, radian: float) -> None:
+        """Move a servo to an angle expressed in radians, with no limit checks."""
+
+        board, chan = divmod(channel_number, 16)
+        self.pcas[board].goto_counts(chan, self.radian_to_count(channel_number, radian, limit=False))
+
+    def move_usec(self, channel_number: int, usec: float) -> None:
+        """Move a servo to an angle expressed in microseconds, with no limit checks."""
+
+        board, chan = divmod(channel_number, 16)
+        self.pcas[board].goto_usec(chan, usec)
+
+    def radian_to_usec(self, channel_number: int, radian: float) -> float:
+        return self.calibration.radian_to_usec(channel_number, radian)
+
+    def usec_to_radian(self, channel_number: int, usec: float) -> float:
+        return self.calibration.usec_to_radian(channel_number, usec)
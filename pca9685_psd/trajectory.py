@@ -0,0 +1,197 @@
+"""Precompute smooth servo motions as arrays of 12-bit PWM counts
+
+A motion is given as waypoints, times and angles in radians, for each channel.
+Splines are fitted through the waypoints and sampled at the PWM frame rate,
+then the calibration and limits are applied to all samples in one pass.
+Playback only writes the precomputed counts, so a gait cycle that repeats
+costs almost nothing per frame.
+
+A Clip plays a motion recorded offline in a .npy file straight from a
+memory mapping, so a long clip needs no more RAM than a short one.
+"""
+
+import time
+
+from collections.abc import Callable, Sequence
+
+import numpy as np
+
+from .pca9685 import PCA9685
+from .servo import Servo
+
+# Spline degree, the ends have zero velocity (cubic) or zero velocity
+# and acceleration (quintic) unless the trajectory is periodic.
+SPLINE_DEGREE = {'cubic': 3, 'quintic': 5}
+
+
+class Trajectory:
+    """A motion sampled at a fixed frame rate.
+
+    counts is a frames x 16 array of 12-bit PWM counts with the calibration
+    and limits already applied.  channels, a mask of 16 bools, is the
+    channels the motion drives, the others are not written.  The default is
+    all of them.
+    """
+
+    def __init__(self, counts: np.ndarray, frame_rate: float, channels: np.ndarray = None):
+
+        self.counts = counts
+        self.frame_rate = frame_rate
+        if channels is None:
+            channels = np.ones(16, dtype=bool)
+        self.channels = channels
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.counts)
+
+    @property
+    def duration(self) -> float:
+        return self.num_frames / self.frame_rate
+
+    @classmethod
+    def from_waypoints(cls,
+                       servo: Servo,
+                       waypoints: dict[int, tuple[Sequence[float], Sequence[float]]],
+                       kind: str = 'cubic',
+                       frame_rate: float = None,
+                       periodic: bool = False) -> 'Trajectory':
+        """Fit splines through waypoints and sample them at the frame rate.
+
+        waypoints maps a channel number to (times, radians), the times are in
+        seconds from the start of the motion.  A channel holds its first angle
+        before its first time and its last angle after its last time.  Channels
+        with no waypoints hold whatever they are set to.  For a periodic motion
+        each channel must end at the angle it starts at, and the last sample is
+        left out so the motion can be looped.
+
+        The default frame rate is the PWM frame rate.
+        """
+
+        from scipy.interpolate import make_interp_spline
+
+        if kind not in SPLINE_DEGREE:
+            raise ValueError('unknown spline kind: ' + str(kind))
+        degree = SPLINE_DEGREE[kind]
+
+        if frame_rate is None:
+            frame_rate = 1.0 / servo.pca.pwm_period
+
+        duration = max(float(times[-1]) for times, radians in waypoints.values())
+        if periodic:
+            num_frames = int(round(duration * frame_rate))
+        else:
+            num_frames = int(duration * frame_rate) + 1
+        t = np.arange(num_frames) / frame_rate
+
+        radians = np.zeros((num_frames, 16))
+        for chan, (times, angles) in waypoints.items():
+            times  = np.asarray(times, dtype=float)
+            angles = np.asarray(angles, dtype=float)
+
+            if periodic:
+                bc_type = 'periodic'
+            elif degree == 3:
+                bc_type = ([(1, 0.0)], [(1, 0.0)])
+            else:
+                bc_type = ([(1, 0.0), (2, 0.0)], [(1, 0.0), (2, 0.0)])
+
+            spline = make_interp_spline(times, angles, k=degree, bc_type=bc_type)
+            radians[:, chan] = spline(np.clip(t, times[0], times[-1]))
+
+        # Calibration, limits and conversion to counts for every sample at once
+        counts = servo.radians_to_counts(radians)
+
+        channels = np.zeros(16, dtype=bool)
+        channels[list(waypoints)] = True
+        counts[:, ~channels] = servo.pca.last_off[~channels]
+
+        return cls(counts, frame_rate, channels)
+
+    def play(self, target: Servo | PCA9685, loops: int = 1) -> None:
+        """Write the frames to a Servo or a PCA9685 at the frame rate, loops times.
+
+        A Servo takes them through move_16_counts(), so in threaded or
+        upsample mode its output thread does the writing.  If a frame is
+        late the following frames are not rushed to catch up.
+        """
+
+        if isinstance(target, Servo):
+            write = target.move_16_counts
+        else:
+            write = target.goto_16_counts
+        _play(lambda frame: write(frame, self.channels), self.counts, self.frame_rate, loops)
+
+    def save(self, path: str) -> None:
+        """Save the counts as a .npy file, which Clip can play."""
+
+        np.save(path, self.counts)
+
+
+class Clip:
+    """A motion clip in a .npy file, a frames x 16 array played from a memory mapping.
+
+    An integer array holds 12-bit counts with the calibration already
+    applied, those rows go straight to the PCA9685.  A float array holds
+    radians, each row is converted with the servo's calibration and limits
+    as it is played.  Only the rows being played are read from the file.
+    """
+
+    def __init__(self, path: str, frame_rate: float, servo: Servo = None):
+
+        self.frames = np.load(path, mmap_mode='r')
+        if self.frames.ndim != 2 or self.frames.shape[1] != 16:
+            raise ValueError('a clip must be a frames x 16 array, not ' + str(self.frames.shape))
+
+        self.in_counts = np.issubdtype(self.frames.dtype, np.integer)
+        if not self.in_counts and servo is None:
+            raise ValueError('a clip in radians needs a Servo to convert it')
+
+        self.frame_rate = frame_rate
+        self.servo = servo
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.frames)
+
+    @property
+    def duration(self) -> float:
+        return self.num_frames / self.frame_rate
+
+    def play(self, pca: PCA9685 = None, loops: int = 1, start: int = 0, stop: int = None) -> None:
+        """Play frames start .. stop-1 at the frame rate, loops times.
+
+        Counts go to pca, or through servo.move_16_counts() if pca is not
+        given.  Radians go through servo.move_16_radian().
+        """
+
+        if pca is None and self.servo is None:
+            raise ValueError('a clip with no Servo needs a PCA9685 to play on')
+
+        frames = self.frames[start:stop]
+        if not self.in_counts:
+            _play(self.servo.move_16_radian, frames, self.frame_rate, loops)
+        elif pca is None:
+            _play(self.servo.move_16_counts, frames, self.frame_rate, loops)
+        else:
+            _play(pca.goto_16_counts, frames, self.frame_rate, loops)
+
+
+def _play(write: Callable[[np.ndarray], None], frames, frame_rate: float, loops: int) -> None:
+    """Call write with each frame at the frame rate, loops times.
+
+    If a frame is late the following frames are not rushed to catch up.
+    """
+
+    period = 1.0 / frame_rate
+    next_time = time.perf_counter()
+    for loop in range(loops):
+        for frame in frames:
+            write(frame)
+
+            next_time += period
+            wait = next_time - time.perf_counter()
+            if wait > 0.0:
+                time.sleep(wait)
+            else:
+                next_time = time.perf_counter()
@@ -0,0 +1,216 @@
+"""Transports carry register reads and writes between PCA9685 and the chip."""
+
+import errno
+import random
+
+from collections.abc import Sequence
+
+
+class Transport:
+    """The bus interface used by PCA9685, a subset of smbus.SMBus."""
+
+    def write_byte_data(self, address: int, reg: int, value: int) -> None:
+        """Write one byte to a register."""
+        raise NotImplementedError
+
+    def read_byte_data(self, address: int, reg: int) -> int:
+        """Read one byte from a register."""
+        raise NotImplementedError
+
+    def write_i2c_block_data(self, address: int, reg: int, data: Sequence[int]) -> None:
+        """Write up to 32 bytes starting at a register."""
+        raise NotImplementedError
+
+    def read_i2c_block_data(self, address: int, reg: int, length: int) -> list[int]:
+        """Read up to 32 bytes starting at a register."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release the bus."""
+        pass
+
+
+class SMBusTransport(Transport):
+    """A real I2C bus, using either the smbus2 or the smbus package.
+
+    Be sure the user is a member of the i2c group.
+    """
+
+    def __init__(self, smbus_number: int = 1):
+
+        try:
+            import smbus2 as smbus
+        except ImportError:
+            import smbus
+
+        self.smbus_number = smbus_number
+        self.bus = smbus.SMBus(smbus_number)
+
+        # Bind the bus methods directly so there is no extra call per transaction
+        self.write_byte_data      = self.bus.write_byte_data
+        self.read_byte_data       = self.bus.read_byte_data
+        self.write_i2c_block_data = self.bus.write_i2c_block_data
+        self.read_i2c_block_data  = self.bus.read_i2c_block_data
+
+    def close(self) -> None:
+        self.bus.close()
+
+
+class SimulatedTransport(Transport):
+    """An in-memory bus of PCA9685 chips, for use with no I2C hardware.
+
+    Each address has a 256 byte register file with the power-on defaults.
+    MODE1 SLEEP and auto-increment, PRESCALE (only writable while asleep)
+    and the ALL_LED broadcast registers behave as the datasheet describes.
+    Transactions and bytes are counted so throughput can be measured, and
+    write errors can be injected to exercise error recovery.
+    """
+
+    MODE1        = 0x00
+    MODE2        = 0x01
+    LED0_ON_L    = 0x06
+    ALLLED_ON_L  = 0xFA
+    ALLLED_OFF_H = 0xFD
+    PRESCALE     = 0xFE
+
+    SLEEP          = 0x10
+    AUTO_INCREMENT = 0x20
+    RESTART        = 0x80
+
+    BLOCK_MAX = 32
+
+    def __init__(self, addresses: Sequence[int] = ()):
+
+        self.devices: dict[int, bytearray] = {}
+        for address in addresses:
+            self.reset(address)
+
+        self.transactions  = 0
+        self.bytes_written = 0
+        self.bytes_read    = 0
+
+        self.fault_rate  = 0.0
+        self.fault_errno = errno.EREMOTEIO
+        self.__random = random.Random()
+
+    def inject_faults(self, rate: float, err: int = errno.EREMOTEIO, seed: int = None) -> None:
+        """Make each write fail with OSError(err) with probability rate, before it has any effect."""
+
+        self.fault_rate  = rate
+        self.fault_errno = err
+        self.__random.seed(seed)
+
+    def __maybe_fail(self) -> None:
+        if self.fault_rate > 0.0 and self.__random.random() < self.fault_rate:
+            raise OSError(self.fault_errno, 'simulated bus error')
+
+    def reset(self, address: int) -> None:
+        """Put the chip at this address in its power-on state."""
+
+        regs = bytearray(256)
+        regs[self.MODE1]    = 0x11      # SLEEP and ALLCALL
+        regs[self.MODE2]    = 0x04      # totem pole outputs
+        regs[0x02]          = 0xE2      # SUBADR1..3
+        regs[0x03]          = 0xE4
+        regs[0x04]          = 0xE8
+        regs[0x05]          = 0xE0      # ALLCALLADR
+        regs[self.PRESCALE] = 0x1E      # 200 Hz
+        for chan in range(16):
+            regs[self.LED0_ON_L + 4 * chan + 3] = 0x10     # LEDn full off
+        self.devices[address] = regs
+
+    def registers(self, address: int) -> bytearray:
+        """The register file for an address, created on first use."""
+
+        if address not in self.devices:
+            self.reset(address)
+        return self.devices[address]
+
+    def reset_counters(self) -> None:
+        self.transactions  = 0
+        self.bytes_written = 0
+        self.bytes_read    = 0
+
+    def __store(self, regs: bytearray, reg: int, value: int) -> None:
+        """Store a byte the way the chip would."""
+
+        value &= 0xFF
+        if reg == self.MODE1:
+            # Writing a one to RESTART clears it
+            regs[reg] = value & ~self.RESTART
+        elif reg == self.PRESCALE:
+            if regs[self.MODE1] & self.SLEEP:
+                regs[reg] = max(value, 3)
+        elif self.ALLLED_ON_L <= reg <= self.ALLLED_OFF_H:
+            offset = reg - self.ALLLED_ON_L
+            for chan in range(16):
+                regs[self.LED0_ON_L + 4 * chan + offset] = value
+        else:
+            regs[reg] = value
+
+    def __load(self, regs: bytearray, reg: int) -> int:
+        """Read a byte the way the chip would, ALL_LED registers read as zero."""
+
+        if self.ALLLED_ON_L <= reg <= self.ALLLED_OFF_H:
+            return 0
+        return regs[reg]
+
+    def __next_reg(self, regs: bytearray, reg: int) -> int:
+        """The register pointer after an access."""
+
+        if not regs[self.MODE1] & self.AUTO_INCREMENT:
+            return reg
+        if reg in (0x45, 0xFF):
+            return 0x00
+        return reg + 1
+
+    def write_byte_data(self, address: int, reg: int, value: int) -> None:
+        self.__maybe_fail()
+        self.transactions  += 1
+        self.bytes_written += 2
+        self.__store(self.registers(address), reg, value)
+
+    def read_byte_data(self, address: int, reg: int) -> int:
+        self.transactions += 1
+        self.bytes_read   += 1
+        return self.__load(self.registers(address), reg)
+
+    def write_i2c_block_data(self, address: int, reg: int, data: Sequence[int]) -> None:
+        if len(data) > self.BLOCK_MAX:
+            raise ValueError('Data length cannot exceed %d bytes' % self.BLOCK_MAX)
+
+        self.__maybe_fail()
+        self.transactions  += 1
+        self.bytes_written += 1 + len(data)
+        regs = self.registers(address)
+        for value in data:
+            self.__store(regs, reg, value)
+            reg = self.__next_reg(regs, reg)
+
+    def read_i2c_block_data(self, address: int, reg: int, length: int) -> list[int]:
+        if length > self.BLOCK_MAX:
+            raise ValueError('Data length cannot exceed %d bytes' % self.BLOCK_MAX)
+
+        self.transactions += 1
+        self.bytes_read   += length
+        regs = self.registers(address)
+        result = []
+        for i in range(length):
+            result.append(self.__load(regs, reg))
+            reg = self.__next_reg(regs, reg)
+        return result
+
+    def led(self, address: int, channel: int) -> tuple[int, int]:
+        """The (on, off) counts of a channel, including the full on/off bits."""
+
+        regs = self.registers(address)
+        base = self.LED0_ON_L + 4 * channel
+        on  = regs[base]     | (regs[base + 1] << 8)
+        off = regs[base + 2] | (regs[base + 3] << 8)
+        return on, off
+
+    def sleeping(self, address: int) -> bool:
+        return bool(self.registers(address)[self.MODE1] & self.SLEEP)
+
+    def prescale(self, address: int) -> int:
+        return self.registers(address)[self.PRESCALE]
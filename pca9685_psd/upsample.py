@@ -0,0 +1,164 @@
+"""Fill in the frames between setpoints that arrive slower than the PWM rate
+
+A control loop that only runs at, say, 20 Hz would step the servos three
+PWM periods at a time at 60 Hz.  An Upsampler takes its setpoints, with
+time stamps, and an OutputThread asks it for a frame every PWM period.
+"""
+
+import threading
+import time
+
+from collections.abc import Sequence
+
+import numpy as np
+
+
+class Upsampler:
+    """Interpolate 12-bit count setpoints to frames at any time.
+
+    LINEAR moves from where the output is when a setpoint arrives to the
+    setpoint, in the time between the last two setpoints.  The output is
+    smooth and lags the setpoints by one interval.
+
+    LIMITED moves towards the latest setpoint as fast as max_velocity
+    (counts per second) and max_acceleration (counts per second squared)
+    allow, braking so as to stop on it.  Either limit may be a number or
+    one value per channel, inf is no limit.
+
+    Time stamps are time.perf_counter() values.  There is no output until
+    the first setpoint, which is output as is.
+
+    initial, the counts the chip already has, is where channels with no
+    setpoint yet stay, and known, a mask of bools, is the channels whose
+    counts are known.  Only those and the channels given setpoints are in
+    the frames, so a channel nothing has set is never written.  With no
+    initial only the channels given setpoints are in the frames.
+    """
+
+    LINEAR  = 'linear'
+    LIMITED = 'limited'
+
+    def __init__(self,
+                 mode: str = LINEAR,
+                 max_velocity: float | Sequence[float] = np.inf,
+                 max_acceleration: float | Sequence[float] = np.inf,
+                 num_channels: int = 16,
+                 initial: Sequence[float] = None,
+                 known: np.ndarray = None):
+
+        if mode not in (self.LINEAR, self.LIMITED):
+            raise ValueError('unknown upsampling mode: ' + str(mode))
+        self.mode = mode
+
+        self.max_velocity     = np.zeros(num_channels)
+        self.max_acceleration = np.zeros(num_channels)
+        self.max_velocity[:]     = max_velocity
+        self.max_acceleration[:] = max_acceleration
+
+        self.__target   = np.zeros(num_channels)
+        self.__start    = np.zeros(num_channels)   # where the LINEAR segment starts
+        self.__position = np.zeros(num_channels)
+        self.__set      = np.zeros(num_channels, dtype=bool)   # the channels in the frames
+        if initial is not None:
+            self.__target[:]   = initial
+            self.__position[:] = initial
+            self.__set[:] = True if known is None else known
+        self.__velocity = np.zeros(num_channels)
+        self.__unlimited_accel = np.isinf(self.max_acceleration)
+
+        self.__have_setpoint = False
+        self.__stamp: float = 0.0           # time stamp of the latest setpoint
+        self.__interval: float = 0.0        # time between the last two setpoints
+        self.__frame_time: float = None     # when frame() was last called
+
+        self.__lock = threading.Lock()
+
+    def set_frame(self, counts: Sequence[float], timestamp: float = None, channels: np.ndarray = None) -> None:
+        """A new setpoint for every channel, timestamp defaults to now.
+
+        channels, a mask of bools, takes only those channels from counts,
+        the others keep their latest setpoints.
+        """
+
+        if timestamp is None:
+            timestamp = time.perf_counter()
+
+        with self.__lock:
+            if channels is None:
+                self.__set[:] = True
+            else:
+                counts = np.where(channels, counts, self.__target)
+                self.__set |= channels
+            if not self.__have_setpoint:
+                self.__position[:] = counts
+                self.__have_setpoint = True
+                self.__interval = 0.0
+            else:
+                self.__interval = timestamp - self.__stamp
+            self.__start[:] = self.__position
+            self.__target[:] = counts
+            self.__stamp = timestamp
+
+    def set_channel(self, channel: int, count: float, timestamp: float = None) -> None:
+        """A new setpoint for one channel, the others keep their latest setpoints."""
+
+        counts = np.zeros(len(self.__target))
+        counts[channel] = count
+        channels = np.zeros(len(self.__target), dtype=bool)
+        channels[channel] = True
+        self.set_frame(counts, timestamp, channels)
+
+    def frame(self, now: float) -> tuple[np.ndarray, np.ndarray]:
+        """The frame to output at time now, in counts, and the mask of the channels to write.
+
+        Returns None before the first setpoint.
+        """
+
+        with self.__lock:
+            if not self.__have_setpoint:
+                return None
+
+            if self.mode == self.LINEAR:
+                self.__linear(now)
+            else:
+                self.__limited(now)
+            self.__frame_time = now
+
+            return np.rint(self.__position).astype(np.int16), self.__set.copy()
+
+    def __linear(self, now: float) -> None:
+
+        if self.__interval <= 0.0:
+            self.__position[:] = self.__target
+            return
+
+        frac = min(max((now - self.__stamp) / self.__interval, 0.0), 1.0)
+        np.subtract(self.__target, self.__start, out=self.__position)
+        self.__position *= frac
+        self.__position += self.__start
+
+    def __limited(self, now: float) -> None:
+
+        if self.__frame_time is None:
+            return
+        dt = now - self.__frame_time
+        if dt <= 0.0:
+            return
+
+        error = self.__target - self.__position
+        dist = np.abs(error)
+
+        # The fastest speed that can still stop on the target, braking
+        # once per frame, and no faster than reaches it this frame
+        half_dv = 0.5 * self.max_acceleration * dt
+        with np.errstate(invalid='ignore'):
+            speed = np.sqrt(half_dv * half_dv + 2.0 * self.max_acceleration * dist) - half_dv
+        speed[self.__unlimited_accel] = np.inf
+        np.minimum(speed, self.max_velocity, out=speed)
+        np.minimum(speed, dist / dt, out=speed)
+
+        max_dv = self.max_acceleration * dt
+        np.clip(np.copysign(speed, error),
+                self.__velocity - max_dv, self.__velocity + max_dv,
+                out=self.__velocity)
+        self.__position += self.__velocity * dt
@@ -0,0 +1,32 @@
+import pytest
+import yaml
+
+from pca9685_psd.pca9685 import PCA9685
+
+
+@pytest.fixture(autouse=True)
+def no_init_delay(monkeypatch):
+    """The simulated chip needs no time to reset or wake up."""
+
+    monkeypatch.setattr(PCA9685, 'delay', 0.0)
+
+
+def write_cal(path, num_channels: int = 16, **extra) -> str:
+    """A linear calibration, 1500 usec at 0 radians and 600 usec per radian, limits 1000..2000 usec."""
+
+    cal = {chan: {'name':             'servo%d' % chan,
+                  'active':           True,
+                  'slope':            600.0,
+                  'intercept':        1500.0,
+                  'usec lower limit': 1000.0,
+                  'usec upper limit': 2000.0}
+           for chan in range(num_channels)}
+    cal.update(extra)
+    with open(path, 'w') as cal_file:
+        yaml.safe_dump(cal, cal_file)
+    return str(path)
+
+
+@pytest.fixture
+def cal_file(tmp_path) -> str:
+    return write_cal(tmp_path / 'servo_cal.yaml')
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from pca9685_psd import AsyncPCA9685, AsyncServo, SimulatedTransport
+
+ADDRESS = 0x40
+
+
+def test_async_pca9685():
+    bus = SimulatedTransport()
+
+    async def main():
+        pca = await AsyncPCA9685.create(transport=bus, address=ADDRESS, bus_frequency=60.0)
+        try:
+            assert not bus.sleeping(ADDRESS)
+            await pca.goto_16_usec(np.full(16, 1500.0))
+            await pca.goto_usec(3, 1000.0)
+            usec_per_count = pca.pca.usec_per_count
+            await pca.setPWMFreq(200.0)
+            return pca.pca, usec_per_count
+        finally:
+            pca.close()
+
+    pca, usec_per_count = asyncio.run(main())
+    assert bus.led(ADDRESS, 0)[1] == round(1500.0 / usec_per_count)
+    assert bus.led(ADDRESS, 3)[1] == round(1000.0 / usec_per_count)
+    assert bus.prescale(ADDRESS) == pca.prescale(200.0)
+
+
+def test_async_servo_runs_the_bus_off_the_loop_thread(cal_file):
+    bus = SimulatedTransport()
+    threads = set()
+
+    async def main():
+        servo = await AsyncServo.create(transport=bus, cal_file=cal_file)
+        write = servo.servo.pca.write_block
+
+        def spy(*args):
+            threads.add(threading.current_thread().name)
+            write(*args)
+
+        servo.servo.pca.write_block = spy
+        try:
+            await servo.move_16_radian(np.zeros(16))
+            await servo.move_radian(2, 0.5)
+            await servo.move_usec(3, 1200.0)
+            assert servo.radian_to_usec(2, 0.5) == 1800.0
+            return servo.servo.pca.usec_per_count
+        finally:
+            servo.close()
+
+    usec_per_count = asyncio.run(main())
+    assert threads and all(name.startswith('pca9685-bus') for name in threads)
+    assert bus.led(ADDRESS, 0)[1] == round(1500.0 / usec_per_count)
+    assert bus.led(ADDRESS, 2)[1] == round(1800.0 / usec_per_count)
+    assert bus.led(ADDRESS, 3)[1] == round(1200.0 / usec_per_count)
@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+from pca9685_psd import bench
+
+
+def test_run_reports_every_pair():
+    results = bench.run(frames=20)
+
+    assert [(r['workload'], r['target']) for r in results] == \
+        [(w, t) for w in bench.WORKLOADS for t in bench.TARGETS]
+    for result in results:
+        assert result['frames'] == 20
+        assert result['frames_per_sec'] > 0.0
+        assert result['transactions_per_frame'] > 0.0
+
+
+def test_json_entry_point():
+    output = subprocess.run([sys.executable, '-m', 'pca9685_psd.bench', '--frames', '10', '--json',
+                             '--workload', 'sinusoid', '--target', 'move_16_radian'],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            check=True, capture_output=True, text=True).stdout
+    results = json.loads(output)
+
+    assert len(results) == 1
+    assert results[0]['target'] == 'move_16_radian'
@@ -0,0 +1,93 @@
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from pca9685_psd import BusDaemon, ServoArray, ServoClient, SimulatedTransport
+from pca9685_psd import protocol
+
+
+@pytest.fixture
+def daemon(cal_file, tmp_path):
+    servos = ServoArray(addresses=[0x40], transport=SimulatedTransport(), cal_file=cal_file)
+    daemon = BusDaemon(servos, str(tmp_path / 'psd.sock'))
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    deadline = time.perf_counter() + 1.0
+    while not (tmp_path / 'psd.sock').exists() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+
+    yield daemon
+
+    daemon.stop()
+    thread.join()
+    assert not (tmp_path / 'psd.sock').exists()
+
+
+def wait_for_frame(daemon, frames_written: int) -> None:
+    deadline = time.perf_counter() + 1.0
+    while daemon.frames_written <= frames_written and time.perf_counter() < deadline:
+        time.sleep(0.005)
+
+
+def send_raw(daemon, message: bytes) -> bytes:
+    """Send one message on a new connection, the reply or b'' if the daemon hung up."""
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET) as sock:
+        sock.connect(daemon.socket_path)
+        sock.settimeout(1.0)
+        sock.send(message)
+        return sock.recv(protocol.MAX_MESSAGE)
+
+
+def test_client_moves_are_merged_and_written(daemon):
+    bus = daemon.servos.pcas[0].bus
+    with ServoClient(daemon.socket_path) as first, ServoClient(daemon.socket_path) as second:
+        assert first.num_channels == 16
+        assert first.frame_rate == pytest.approx(1.0 / daemon.period)
+
+        frames_written = daemon.frames_written
+        first.move_16_radian([0.0] * 4)
+        second.move_radian(8, 0.5)
+        second.move_usec(9, 1200.0)
+        time.sleep(0.01)
+        wait_for_frame(daemon, frames_written)
+
+        usec_per_count = daemon.servos.pcas[0].usec_per_count
+        assert [bus.led(0x40, chan)[1] for chan in range(4)] == [round(1500.0 / usec_per_count)] * 4
+        assert bus.led(0x40, 8)[1] == round(1800.0 / usec_per_count)
+        assert bus.led(0x40, 9)[1] == round(1200.0 / usec_per_count)
+        assert bus.led(0x40, 10) == (0, 0x1000)      # never moved, still as reset
+
+        assert first.radian_to_usec(3, 0.5) == pytest.approx(1800.0)
+        assert first.usec_to_radian(3, 1800.0) == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize('message', [
+    struct.pack('<BBHB', protocol.RADIAN_TO_USEC, 0, 1, 0),                           # short body
+    protocol.HEADER.pack(protocol.MOVE_ALL, 0, 2) + struct.pack('<2f', 0.1, np.nan),
+    protocol.HEADER.pack(protocol.MOVE_CHANNELS, 0, 2) +
+        protocol.CHANNEL_VALUE.pack(0, 0.1) + protocol.CHANNEL_VALUE.pack(1, np.inf),
+    protocol.HEADER.pack(protocol.MOVE_CHANNELS, 0, 1) + protocol.CHANNEL_VALUE.pack(99, 0.0),
+    protocol.HEADER.pack(99, 0, 0),
+    b'\x01',
+])
+def test_bad_message_drops_only_that_client(daemon, message):
+    with ServoClient(daemon.socket_path) as client:
+        frame = daemon.frame.copy()
+        assert send_raw(daemon, message) == b''
+        assert (daemon.frame == frame).all()
+        assert client.radian_to_usec(0, 0.0) == pytest.approx(1500.0)
+
+
+def test_client_gone_before_reply(daemon):
+    for attempt in range(5):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET) as sock:
+            sock.connect(daemon.socket_path)
+            sock.send(protocol.HEADER.pack(protocol.INFO, 0, 1))
+
+    with ServoClient(daemon.socket_path) as client:
+        assert client.num_channels == 16
@@ -0,0 +1,75 @@
+import threading
+
+import numpy as np
+import pytest
+
+from pca9685_psd import BusDispatcher, PCA9685, RetryPolicy, SimulatedTransport
+
+
+class NumberedTransport(SimulatedTransport):
+    """A simulated bus that says which SMBus it is, as SMBusTransport does."""
+
+    def __init__(self, smbus_number: int):
+        super().__init__()
+        self.smbus_number = smbus_number
+
+
+def test_boards_on_each_bus_are_written():
+    buses = [SimulatedTransport(), SimulatedTransport()]
+    pcas = [PCA9685(transport=buses[0], address=0x40),
+            PCA9685(transport=buses[0], address=0x41),
+            PCA9685(transport=buses[1], address=0x40)]
+    frames = np.array([np.full(16, 300), np.full(16, 310), np.full(16, 320)])
+
+    with BusDispatcher(pcas) as dispatcher:
+        assert dispatcher.groups == [[0, 1], [2]]
+        dispatcher.goto_16_counts(frames)
+
+    assert buses[0].led(0x40, 5) == (0, 300)
+    assert buses[0].led(0x41, 5) == (0, 310)
+    assert buses[1].led(0x40, 5) == (0, 320)
+
+
+def test_second_bus_is_written_on_a_worker_thread():
+    pcas = [PCA9685(transport=SimulatedTransport()), PCA9685(transport=SimulatedTransport())]
+    threads = []
+    for pca in pcas:
+        write = pca.goto_16_counts
+        def spy(*args, write=write):
+            threads.append(threading.current_thread().name)
+            write(*args)
+        pca.goto_16_counts = spy
+
+    with BusDispatcher(pcas) as dispatcher:
+        dispatcher.goto_16_counts(np.full((2, 16), 300))
+
+    main = threading.current_thread().name
+    assert main in threads
+    assert [name for name in threads if name != main][0].startswith('pca9685-bus')
+
+
+def test_same_smbus_number_is_one_bus():
+    pcas = [PCA9685(transport=NumberedTransport(1), address=0x40),
+            PCA9685(transport=NumberedTransport(1), address=0x41),
+            PCA9685(transport=NumberedTransport(3), address=0x40)]
+
+    with BusDispatcher(pcas) as dispatcher:
+        assert dispatcher.groups == [[0, 1], [2]]
+
+
+def test_a_bus_error_is_raised_after_the_frame():
+    good, bad = SimulatedTransport(), SimulatedTransport()
+    pcas = [PCA9685(transport=good),
+            PCA9685(transport=bad, retry=RetryPolicy(raise_on_failure=True))]
+    bad.inject_faults(1.0, seed=0)
+
+    with BusDispatcher(pcas) as dispatcher:
+        with pytest.raises(OSError):
+            dispatcher.goto_16_counts(np.full((2, 16), 300))
+
+    assert good.led(0x40, 0) == (0, 300)
+
+
+def test_no_boards():
+    with pytest.raises(ValueError):
+        BusDispatcher([])
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from pca9685_psd import Instrument, LatencyHistogram, PCA9685, Servo, SimulatedTransport
+
+ADDRESS = 0x40
+COUNTS = np.arange(16) * 20 + 200
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    assert histogram.summary() == {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+
+    for n in range(99):
+        histogram.record(10e-6)
+    histogram.record(1e-3)
+
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert summary['mean'] == pytest.approx(19.9)
+    # A percentile is the upper edge of its bucket, four buckets per octave
+    assert 10.0 <= summary['p50'] <= 12.5
+    assert summary['p99'] == summary['p50']
+    assert summary['max'] == pytest.approx(1000.0)
+    assert histogram.percentile(100.0) == pytest.approx(1000.0)
+
+    histogram.reset()
+    assert histogram.count == 0
+
+
+def test_frames_are_counted():
+    bus = SimulatedTransport()
+    records = []
+    instrument = Instrument(callback=records.append)
+    pca = PCA9685(transport=bus, address=ADDRESS, pacing=PCA9685.PACING_NONE, instrument=instrument)
+
+    bus.reset_counters()
+    pca.goto_16_counts(COUNTS)
+    pca.goto_16_counts(COUNTS)
+
+    snapshot = instrument.snapshot()
+    assert snapshot['frames'] == 2
+    assert snapshot['transactions'] == bus.transactions == 2
+    assert snapshot['bytes_written'] == bus.bytes_written
+    assert snapshot['skipped_channels'] == 16       # nothing moved in the second frame
+    assert snapshot['write_usec']['count'] == 2
+    assert [record['transactions'] for record in records] == [2, 0]
+    assert records[1]['skipped'] == 16
+
+    instrument.reset()
+    assert instrument.snapshot()['frames'] == 0
+
+
+def test_servo_records_the_conversion(cal_file):
+    instrument = Instrument()
+    servo = Servo(transport=SimulatedTransport(), cal_file=cal_file, instrument=instrument)
+    servo.move_16_radian(np.zeros(16))
+
+    assert instrument.convert.count == 1
+    assert instrument.frames == 1
@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+
+from pca9685_psd import OutputThread, PCA9685, Servo, SimulatedTransport
+
+ADDRESS = 0x40
+FULL_OFF = 0x1000
+
+
+def wait_for(condition, timeout: float = 1.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.002)
+
+
+def test_latest_frame_wins():
+    bus = SimulatedTransport()
+    pca = PCA9685(transport=bus, address=ADDRESS)
+    output = OutputThread(pca, frequency=50.0)
+    output.start()
+    try:
+        time.sleep(0.005)
+        for count in (300, 310, 320):
+            output.submit(np.full(16, count))
+        wait_for(lambda: output.frames_written >= 1)
+    finally:
+        output.stop()
+
+    assert bus.led(ADDRESS, 0) == (0, 320)
+    stats = output.stats()
+    assert stats['submitted'] == 3
+    assert stats['superseded'] >= 1
+    assert stats['written'] >= 1
+
+
+def test_submit_channel_keeps_the_other_channels():
+    bus = SimulatedTransport()
+    pca = PCA9685(transport=bus, address=ADDRESS)
+    pca.goto_16_counts(np.full(16, 300))
+
+    output = OutputThread(pca, frequency=200.0)
+    output.start()
+    try:
+        output.submit_channel(4, 350)
+        wait_for(lambda: output.frames_written >= 1)
+    finally:
+        output.stop()
+
+    assert bus.led(ADDRESS, 4) == (0, 350)
+    assert bus.led(ADDRESS, 5) == (0, 300)
+
+
+def test_threaded_servo_writes_from_the_thread(cal_file):
+    bus = SimulatedTransport()
+    servo = Servo(transport=bus, cal_file=cal_file, threaded=True)
+    try:
+        servo.move_16_radian(np.zeros(16))
+        wait_for(lambda: servo.output.frames_written >= 1)
+    finally:
+        servo.close()
+
+    assert bus.led(ADDRESS, 0)[1] == round(1500.0 / servo.pca.usec_per_count)
+
+
+def test_unknown_channels_are_not_moved():
+    bus = SimulatedTransport()
+    pca = PCA9685(transport=bus, address=ADDRESS)
+    pca.goto_16_counts(np.full(16, 300))
+    pca.all_full_off()
+
+    output = OutputThread(pca, frequency=200.0)
+    output.start()
+    try:
+        output.submit_channel(0, 400)
+        wait_for(lambda: output.frames_written >= 1)
+    finally:
+        output.stop()
+
+    assert bus.led(ADDRESS, 0) == (0, 400)
+    assert [bus.led(ADDRESS, chan) for chan in range(1, 16)] == [(0, FULL_OFF)] * 15
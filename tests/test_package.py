@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import pca9685_psd
+
+
+def test_import_is_lazy():
+    code = ('import sys, pca9685_psd\n'
+            'heavy = [name for name in ("numpy", "yaml", "smbus", "pca9685_psd.servo") '
+            'if name in sys.modules]\n'
+            'print(",".join(heavy))\n')
+    root = os.path.dirname(os.path.dirname(pca9685_psd.__file__))
+    result = subprocess.run([sys.executable, '-c', code], cwd=root,
+                            capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == ''
+
+
+@pytest.mark.parametrize('name', pca9685_psd.__all__)
+def test_exports_resolve(name):
+    value = getattr(pca9685_psd, name)
+
+    assert value.__name__ == name
+    assert name in dir(pca9685_psd)
+
+
+def test_unknown_name():
+    with pytest.raises(AttributeError):
+        pca9685_psd.NoSuchThing
@@ -0,0 +1,305 @@
+import errno
+import time
+
+import numpy as np
+import pytest
+
+from pca9685_psd import PCA9685, RetryPolicy, Servo, SimulatedTransport
+
+from conftest import write_cal
+
+ADDRESS = 0x40
+MODE2 = 0x01
+OCH = 0x08
+FULL_OFF = 0x1000
+
+
+def make_pca(**kwargs):
+    bus = SimulatedTransport()
+    kwargs.setdefault('pacing', PCA9685.PACING_NONE)
+    return PCA9685(transport=bus, address=ADDRESS, **kwargs), bus
+
+
+def offs(bus, channels=range(16)):
+    return [bus.led(ADDRESS, chan) for chan in channels]
+
+
+COUNTS = np.arange(16) * 20 + 200
+
+
+@pytest.mark.parametrize('mode', [{}, {'block_write': False}, {'atomic': True}])
+def test_goto_16_counts_sets_registers(mode):
+    pca, bus = make_pca(**mode)
+    pca.goto_16_counts(COUNTS)
+
+    assert offs(bus) == [(0, int(count)) for count in COUNTS]
+    assert not bus.sleeping(ADDRESS)
+    assert pca.last_off.tolist() == COUNTS.tolist()
+
+
+def test_block_frame_is_two_transactions():
+    pca, bus = make_pca()
+    bus.reset_counters()
+    pca.goto_16_counts(COUNTS)
+
+    assert bus.transactions == 2        # 8 channels per block
+
+
+def test_byte_frame_is_one_transaction_per_register():
+    pca, bus = make_pca(block_write=False)
+    bus.reset_counters()
+    pca.goto_16_counts(COUNTS)
+    assert bus.transactions == 64
+
+    # Once the registers are known only the bytes that change are written
+    bus.reset_counters()
+    pca.goto_16_counts(COUNTS + 1)
+    assert bus.transactions == 16
+
+
+def test_goto_16_usec_converts_with_the_real_period():
+    pca, bus = make_pca()
+    pca.goto_16_usec(np.full(16, 1500.0))
+
+    assert offs(bus) == [(0, round(1500.0 / pca.usec_per_count))] * 16
+
+
+def test_diff_sends_only_changed_channels():
+    pca, bus = make_pca()
+    pca.goto_16_counts(COUNTS)
+    bus.reset_counters()
+
+    counts = COUNTS.copy()
+    counts[5] += 1
+    pca.goto_16_counts(counts)
+
+    assert bus.transactions == 1
+    assert bus.led(ADDRESS, 5) == (0, int(counts[5]))
+
+
+def test_deadband_skips_small_moves():
+    pca, bus = make_pca(deadband=2)
+    pca.goto_16_counts(COUNTS)
+    bus.reset_counters()
+    pca.goto_16_counts(COUNTS + 2)
+
+    assert bus.transactions == 0
+    assert pca.last_off.tolist() == COUNTS.tolist()
+
+
+def test_broadcast_then_diff_frames():
+    pca, bus = make_pca()
+    bus.reset_counters()
+    pca.goto_all_counts(300)
+
+    assert bus.transactions == 1
+    assert offs(bus) == [(0, 300)] * 16
+
+    counts = np.full(16, 300)
+    counts[3] = 310
+    bus.reset_counters()
+    pca.goto_16_counts(counts)
+    assert bus.transactions == 1
+
+    # After a full off every channel is unknown and the next frame rewrites them all
+    pca.all_full_off()
+    assert offs(bus) == [(0, FULL_OFF)] * 16
+    pca.goto_16_counts(counts)
+    assert offs(bus) == [(0, int(count)) for count in counts]
+
+
+def test_channel_mask_leaves_unknown_channels_alone():
+    pca, bus = make_pca()
+    pca.all_full_off()
+    channels = np.zeros(16, dtype=bool)
+    channels[2] = True
+    pca.goto_16_counts(COUNTS, channels)
+
+    assert bus.led(ADDRESS, 2) == (0, int(COUNTS[2]))
+    assert bus.led(ADDRESS, 3) == (0, FULL_OFF)
+    assert pca.off_unknown.sum() == 15
+
+
+def test_atomic_frame_writes_whole_channels():
+    pca, bus = make_pca(atomic=True)
+    assert bus.registers(ADDRESS)[MODE2] & OCH
+
+    pca.goto_16_counts(COUNTS)
+    bus.reset_counters()
+    counts = COUNTS.copy()
+    counts[5] += 1
+    pca.goto_16_counts(counts)
+
+    # With OCH a channel only latches once its OFF_H is written, so all four registers go out
+    assert (bus.transactions, bus.bytes_written) == (1, 5)
+    assert bus.led(ADDRESS, 5) == (0, int(counts[5]))
+
+
+def test_frame_align_needs_a_measured_phase():
+    pca, bus = make_pca(frame_align=True)
+    start = time.perf_counter()
+    for step in range(10):
+        pca.goto_16_counts(COUNTS + step)
+
+    assert pca.unaligned_frames == 10
+    assert time.perf_counter() - start < pca.pwm_period
+
+
+def test_frame_align_waits_for_the_pulses_to_end():
+    pca, bus = make_pca(frame_align=True)
+    start = time.perf_counter()
+    pca.sync_phase(start)
+    pca.goto_16_counts(COUNTS)
+
+    assert pca.unaligned_frames == 0
+    assert time.perf_counter() - start >= COUNTS.max() * pca.pwm_period / 4096.0
+
+
+def test_attach_seeds_shadow_without_writing():
+    pca, bus = make_pca()
+    pca.goto_16_counts(COUNTS)
+    pca.all_full_off()
+    pca.goto_16_counts(COUNTS, np.arange(16) < 4)
+
+    bus.reset_counters()
+    attached = PCA9685(transport=bus, address=ADDRESS, attach=True)
+    assert attached.attached
+    assert bus.bytes_written == 0
+    assert attached.last_off[:4].tolist() == COUNTS[:4].tolist()
+    assert attached.off_unknown.tolist() == [False] * 4 + [True] * 12
+
+    # Nothing is written until a frame changes something
+    attached.goto_16_counts(attached.last_off, ~attached.off_unknown)
+    assert bus.bytes_written == 0
+
+
+def test_attach_resets_a_chip_set_up_differently():
+    pca, bus = make_pca(bus_frequency=60.0)
+    pca.goto_16_counts(COUNTS)
+    other = PCA9685(transport=bus, address=ADDRESS, bus_frequency=200.0, attach=True)
+
+    assert not other.attached
+    assert bus.prescale(ADDRESS) == other.prescale(200.0)
+
+
+def test_only_changed_bytes_are_written():
+    pca, bus = make_pca()
+    pca.goto_16_counts(COUNTS)
+    bus.reset_counters()
+
+    counts = COUNTS.copy()
+    counts[5] += 1
+    pca.goto_16_counts(counts)
+    assert (bus.transactions, bus.bytes_written) == (1, 2)     # OFF_L of channel 5 only
+
+    bus.reset_counters()
+    pca.goto_counts(5, int(counts[5]))
+    assert bus.transactions == 0
+
+
+def test_atomic_goto_counts_writes_the_whole_channel():
+    pca, bus = make_pca(atomic=True)
+    pca.goto_16_counts(COUNTS)
+
+    # A single channel move must load all four registers too, or OCH never latches it
+    bus.reset_counters()
+    pca.goto_counts(6, int(COUNTS[6]) + 1)
+    assert (bus.transactions, bus.bytes_written) == (1, 5)
+    assert bus.led(ADDRESS, 6) == (0, int(COUNTS[6]) + 1)
+
+
+def test_failed_write_is_repaired_by_next_frame():
+    pca, bus = make_pca()
+    bus.inject_faults(1.0, seed=1)
+    pca.goto_16_counts(COUNTS)
+
+    assert pca.write_failures == 2
+    assert pca.retries == 2
+    assert pca.off_unknown.all()
+
+    bus.inject_faults(0.0)
+    pca.goto_16_counts(COUNTS)
+    assert offs(bus) == [(0, int(count)) for count in COUNTS]
+    assert not pca.off_unknown.any()
+
+
+def test_raise_on_failure():
+    pca, bus = make_pca(retry=RetryPolicy(raise_on_failure=True))
+    bus.inject_faults(1.0, err=errno.EIO, seed=1)
+
+    with pytest.raises(OSError):
+        pca.goto_16_counts(COUNTS)
+
+
+def time_writes(pca, count: int) -> float:
+    start = time.perf_counter()
+    for value in range(count):
+        pca.write(0x06, value)
+    return time.perf_counter() - start
+
+
+def test_pacing_policies():
+    gap_usec = 2000.0
+    pca, bus = make_pca(pacing=PCA9685.PACING_FIXED, pacing_usec=gap_usec)
+    assert time_writes(pca, 5) >= 5 * gap_usec / 1e6
+
+    pca, bus = make_pca(pacing=PCA9685.PACING_MIN_GAP, pacing_usec=gap_usec)
+    assert time_writes(pca, 5) >= 4 * gap_usec / 1e6
+
+    # min_gap does not wait when the bus has been idle long enough
+    time.sleep(gap_usec / 1e6)
+    start = time.perf_counter()
+    pca.write(0x06, 0)
+    assert time.perf_counter() - start < gap_usec / 1e6
+
+    pca, bus = make_pca(pacing=PCA9685.PACING_NONE, pacing_usec=gap_usec)
+    assert time_writes(pca, 5) < 5 * gap_usec / 1e6
+
+
+def test_unknown_pacing_policy():
+    with pytest.raises(ValueError):
+        make_pca(pacing='sometimes')
+
+
+@pytest.mark.parametrize('frequency', [50.0, 60.0, 300.0])
+def test_usec_per_count_follows_the_prescale(frequency):
+    pca, bus = make_pca(bus_frequency=frequency)
+    prescale = bus.prescale(ADDRESS)
+    period = (prescale + 1) * 4096 * pca.clock_correction / 25000000.0
+
+    assert prescale == pca.prescale(frequency)
+    assert pca.pwm_period == pytest.approx(period)
+    assert pca.usec_per_count == pytest.approx(period * 1e6 / 4096)
+    assert 1.0 / pca.pwm_period == pytest.approx(frequency, rel=0.02)
+
+
+def test_prescale_is_clamped():
+    pca, bus = make_pca()
+
+    assert pca.prescale(5000.0) == 3
+    assert pca.prescale(1.0) == 255
+
+
+def test_bus_budget():
+    pca, bus = make_pca(bus_frequency=60.0)
+    budget = pca.bus_budget()
+    # Two 32 byte block writes of 308 bits each at 400 kHz
+    assert budget['full_frame_usec'] == pytest.approx(1540.0)
+    assert budget['max_full_frame_rate'] == pytest.approx(1e6 / 1540.0)
+    assert budget['max_channels_per_frame'] == 16
+    assert budget['usec_per_count'] == pca.usec_per_count
+
+    # At the fastest PWM rate a period of about 600 usec carries 50 + 90 usec per channel
+    pca, bus = make_pca(bus_frequency=1500.0)
+    assert pca.bus_budget()['max_channels_per_frame'] == 6
+    assert pca.bus_budget(i2c_hz=1000000.0)['max_channels_per_frame'] == 15
+
+
+def test_frequency_from_the_calibration_file(tmp_path):
+    cal_file = write_cal(tmp_path / 'servo_cal.yaml', **{'pwm frequency': 200.0})
+    bus = SimulatedTransport()
+    servo = Servo(transport=bus, cal_file=cal_file)
+
+    assert bus.prescale(ADDRESS) == servo.pca.prescale(200.0)
+    servo.move_16_radian(np.zeros(16))
+    assert bus.led(ADDRESS, 0)[1] == round(1500.0 / servo.pca.usec_per_count)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from pca9685_psd import PCA9685, Recorder, Servo, SimulatedTransport
+
+
+def test_ring_keeps_the_latest_frames():
+    recorder = Recorder(size=4)
+    for n in range(6):
+        recorder.record_radians(np.full(16, n / 10.0))
+        recorder.record_frame(np.full(16, 300 + n), np.arange(16) < n)
+
+    assert len(recorder) == 4
+    assert recorder.num_frames == 6
+    frames = recorder.frames()
+    assert frames['counts'][:, 0].tolist() == [302, 303, 304, 305]
+    assert frames['radians'][:, 0] == pytest.approx([0.2, 0.3, 0.4, 0.5])
+    assert frames['written'].sum(axis=1).tolist() == [2, 3, 4, 5]
+    assert np.all(np.diff(frames['time']) >= 0.0)
+
+
+def test_frames_without_radians_record_nan():
+    recorder = Recorder(size=4)
+    recorder.record_radians(np.zeros(16))
+    recorder.record_frame(np.full(16, 300), np.ones(16, dtype=bool))
+    recorder.record_frame(np.full(16, 310), np.ones(16, dtype=bool))
+
+    radians = recorder.frames()['radians']
+    assert radians[0].tolist() == [0.0] * 16
+    assert np.isnan(radians[1]).all()
+
+
+def test_servo_records_what_it_writes(cal_file):
+    recorder = Recorder(size=8)
+    servo = Servo(transport=SimulatedTransport(), cal_file=cal_file, recorder=recorder)
+    radians = np.zeros(16)
+    radians[3] = 0.5
+    servo.move_16_radian(radians)
+    servo.move_16_radian(radians)
+
+    frames = recorder.frames()
+    assert frames['counts'].tolist() == [servo.radians_to_counts(radians).tolist()] * 2
+    assert frames['radians'][0].tolist() == radians.tolist()
+    assert frames['written'][0].all()
+    assert not frames['written'][1].any()       # nothing moved
+
+
+def test_dump_and_load(tmp_path):
+    recorder = Recorder(size=4)
+    pca = PCA9685(transport=SimulatedTransport(), pacing=PCA9685.PACING_NONE, recorder=recorder)
+    for n in range(5):
+        pca.goto_16_counts(np.full(16, 300 + n))
+
+    path = str(tmp_path / 'frames.npz')
+    recorder.dump(path)
+    frames = Recorder.load(path)
+    assert frames['num_frames'] == 5
+    assert frames['counts'].tolist() == recorder.frames()['counts'].tolist()
+
+
+def test_dump_on_error(tmp_path):
+    recorder = Recorder(size=4)
+    recorder.record_frame(np.full(16, 300), np.ones(16, dtype=bool))
+    path = str(tmp_path / 'crash.npz')
+
+    with pytest.raises(RuntimeError):
+        with recorder.dump_on_error(path):
+            raise RuntimeError('servo jammed')
+    assert Recorder.load(path)['num_frames'] == 1
+
+    with recorder.dump_on_error(str(tmp_path / 'fine.npz')):
+        pass
+    assert not (tmp_path / 'fine.npz').exists()
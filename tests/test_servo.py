@@ -0,0 +1,144 @@
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+from pca9685_psd import Servo, SimulatedTransport
+from pca9685_psd import servo as servo_module
+from pca9685_psd.servo import CalibrationLUT, fit_usec, load_calibration
+
+from conftest import write_cal
+
+ADDRESS = 0x40
+
+PIECEWISE = {'fit': 'piecewise', 'points': [[1000.0, -1.0], [1400.0, 0.0], [2000.0, 1.0]]}
+POLY = {'fit': 'poly', 'coefficients': [100.0, 600.0, 1500.0]}
+
+
+def write_fit_cal(path, fit: dict) -> str:
+    """The linear test calibration with channel 0 changed to another fit."""
+
+    write_cal(path)
+    with open(path) as cal_file:
+        cal = yaml.safe_load(cal_file)
+    cal[0].update(fit)
+    with open(path, 'w') as cal_file:
+        yaml.safe_dump(cal, cal_file)
+    return str(path)
+
+
+def test_move_16_radian_applies_calibration_and_limits(cal_file):
+    bus = SimulatedTransport()
+    servo = Servo(transport=bus, cal_file=cal_file)
+    radians = np.zeros(16)
+    radians[1] = 0.5
+    radians[2] = 5.0        # past the upper limit
+    servo.move_16_radian(radians)
+
+    usec_per_count = servo.pca.usec_per_count
+    assert bus.led(ADDRESS, 0)[1] == round(1500.0 / usec_per_count)
+    assert bus.led(ADDRESS, 1)[1] == round(1800.0 / usec_per_count)
+    assert bus.led(ADDRESS, 2)[1] == round(2000.0 / usec_per_count)
+
+
+@pytest.mark.parametrize('radian', [-3.0, -0.4, 0.0, 0.123, 0.8, 3.0])
+def test_counts_match_the_usec_path(cal_file, radian):
+    servo = Servo(transport=SimulatedTransport(), cal_file=cal_file)
+
+    usec = min(max(servo.radian_to_usec(0, radian), 1000.0), 2000.0)
+    count = servo.calibration.radian_to_count(0, radian)
+    assert count == round(usec / servo.pca.usec_per_count)
+    assert servo.radians_to_counts(np.full(16, radian)).tolist() == [count] * 16
+
+
+@pytest.mark.parametrize('fit', [PIECEWISE, POLY])
+def test_lut_follows_the_fit(fit):
+    lut = CalibrationLUT.from_fits([fit])
+    radians = np.linspace(-1.0, 1.0, 101)
+
+    # Well inside one count, a piecewise corner between samples is the worst case
+    usecs = np.array([lut.lookup_channel(0, radian) for radian in radians])
+    assert usecs == pytest.approx(fit_usec(fit, radians), abs=0.25)
+    assert lut.lookup(radians[:, None])[:, 0] == pytest.approx(usecs)
+    assert [lut.inverse(0, usec) for usec in usecs] == pytest.approx(radians, abs=1e-4)
+
+
+def test_piecewise_is_extended_past_the_last_point():
+    lut = CalibrationLUT.from_fits([PIECEWISE])
+
+    assert lut.lookup_channel(0, 1.5) == pytest.approx(2300.0)
+    assert lut.lookup_channel(0, -1.5) == pytest.approx(800.0)
+    assert lut.inverse(0, 2300.0) == pytest.approx(1.5)
+
+
+def test_servo_converts_through_the_lut(tmp_path):
+    cal_file = write_fit_cal(tmp_path / 'servo_cal.yaml', PIECEWISE)
+    bus = SimulatedTransport()
+    servo = Servo(transport=bus, cal_file=cal_file)
+    radians = np.zeros(16)
+    radians[0] = 0.5
+    servo.move_16_radian(radians)
+
+    usec_per_count = servo.pca.usec_per_count
+    assert bus.led(ADDRESS, 0)[1] == round(1700.0 / usec_per_count)
+    assert bus.led(ADDRESS, 1)[1] == round(1500.0 / usec_per_count)
+    assert servo.radian_to_usec(0, -0.5) == pytest.approx(1200.0)
+    assert servo.usec_to_radian(0, 1200.0) == pytest.approx(-0.5, abs=1e-4)
+
+
+def test_unknown_fit(tmp_path):
+    cal_file = write_fit_cal(tmp_path / 'servo_cal.yaml', {'fit': 'spline'})
+
+    with pytest.raises(ValueError):
+        load_calibration(cal_file, cache=False)
+
+
+def cache_path(cal_file: str) -> str:
+    return os.path.splitext(cal_file)[0] + '.16.npz'
+
+
+def test_cache_is_written_and_used(cal_file, monkeypatch):
+    cal = load_calibration(cal_file)
+    assert os.path.exists(cache_path(cal_file))
+
+    def no_parse(contents, num_channels):
+        raise AssertionError('the YAML was parsed again')
+
+    monkeypatch.setattr(servo_module, '_parse_calibration', no_parse)
+    cached = load_calibration(cal_file)
+    assert cached['slope'].tolist() == cal['slope'].tolist()
+    assert cached['names'] == cal['names']
+
+
+def test_cache_keeps_the_lut(tmp_path):
+    cal_file = write_fit_cal(tmp_path / 'servo_cal.yaml', PIECEWISE)
+    cal = load_calibration(cal_file)
+    cached = load_calibration(cal_file)
+
+    assert cached['fit'] == cal['fit']
+    assert cached['lut'].table.tolist() == cal['lut'].table.tolist()
+
+
+def test_cache_is_rebuilt_when_the_file_changes(cal_file):
+    load_calibration(cal_file)
+    write_cal(cal_file, **{'pwm frequency': 200.0})
+
+    assert load_calibration(cal_file)['frequency'] == 200.0
+
+
+@pytest.mark.parametrize('junk', [b'', b'not a zip file', b'PK\x03\x04cut short'])
+def test_corrupt_cache_is_rebuilt(cal_file, junk):
+    with open(cache_path(cal_file), 'wb') as cache:
+        cache.write(junk)
+
+    cal = load_calibration(cal_file)
+    assert cal['slope'][0] == 600.0
+    assert os.path.getsize(cache_path(cal_file)) > len(junk)
+    assert load_calibration(cal_file)['slope'][0] == 600.0
+
+
+def test_no_cache(cal_file):
+    load_calibration(cal_file, cache=False)
+
+    assert not os.path.exists(cache_path(cal_file))
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from pca9685_psd import Servo, ServoArray, SimulatedTransport
+
+from conftest import write_cal
+
+
+@pytest.fixture
+def cal_file_32(tmp_path) -> str:
+    return write_cal(tmp_path / 'servo_cal.yaml', num_channels=32)
+
+
+def test_global_channel_numbers(cal_file_32):
+    bus = SimulatedTransport()
+    servos = ServoArray(addresses=[0x40, 0x41], transport=bus, cal_file=cal_file_32)
+    usec_per_count = servos.pcas[0].usec_per_count
+
+    servos.move_radian(17, 0.5)
+    servos.move_usec(3, 1200.0)
+
+    assert servos.board_channel(17) == (1, 1)
+    assert bus.led(0x41, 1)[1] == round(1800.0 / usec_per_count)
+    assert bus.led(0x40, 3)[1] == round(1200.0 / usec_per_count)
+    assert bus.led(0x40, 1) == (0, 0x1000)
+
+
+def test_move_all_radian_flat_or_per_board(cal_file_32):
+    bus = SimulatedTransport()
+    servos = ServoArray(addresses=[0x40, 0x41], transport=bus, cal_file=cal_file_32)
+    radians = np.linspace(-0.5, 0.5, 32)
+
+    servos.move_all_radian(radians.reshape(2, 16))
+    flat = [bus.led(address, chan)[1] for address in (0x40, 0x41) for chan in range(16)]
+    assert flat == servos.radians_to_counts(radians).tolist()
+
+    # Past the limits only with nolimit
+    servos.move_all_radian_nolimit(np.full(32, 1.0))
+    assert bus.led(0x41, 15)[1] == servos.radian_to_count(31, 1.0, limit=False)
+    assert servos.radian_to_count(31, 1.0) < servos.radian_to_count(31, 1.0, limit=False)
+
+
+def test_same_conversions_as_servo(cal_file):
+    servo = Servo(transport=SimulatedTransport(), cal_file=cal_file)
+    servos = ServoArray(addresses=[0x40], transport=SimulatedTransport(), cal_file=cal_file)
+    radians = np.linspace(-2.0, 2.0, 16)
+
+    assert servos.radians_to_counts(radians).tolist() == servo.radians_to_counts(radians).tolist()
+    assert servos.radian_to_usec(4, 0.3) == servo.radian_to_usec(4, 0.3)
+    assert servos.usec_to_radian(4, 1700.0) == pytest.approx(servo.usec_to_radian(4, 1700.0))
+
+
+def test_smbus_numbers_must_match_addresses(cal_file_32):
+    with pytest.raises(ValueError):
+        ServoArray(addresses=[0x40, 0x41], smbus_numbers=[1], noi2c=True, cal_file=cal_file_32)
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from pca9685_psd import Clip, Servo, SimulatedTransport, Trajectory
+
+ADDRESS = 0x40
+
+
+@pytest.fixture
+def servo(cal_file):
+    return Servo(transport=SimulatedTransport(), cal_file=cal_file)
+
+
+def test_waypoints_are_hit(servo):
+    trajectory = Trajectory.from_waypoints(servo, {0: ([0.0, 0.5, 1.0], [0.0, 0.4, -0.2])},
+                                           frame_rate=100.0)
+
+    assert trajectory.counts.shape == (101, 16)
+    assert trajectory.duration == pytest.approx(1.01)
+    expected = servo.radians_to_counts(np.array([[0.0] * 16, [0.4] * 16, [-0.2] * 16]))[:, 0]
+    assert trajectory.counts[[0, 50, 100], 0].tolist() == expected.tolist()
+
+
+def test_quintic_and_periodic(servo):
+    quintic = Trajectory.from_waypoints(servo, {1: ([0.0, 1.0], [0.0, 0.5])}, kind='quintic',
+                                        frame_rate=100.0)
+    # Zero velocity and acceleration at the ends, so it starts slower than the cubic
+    cubic = Trajectory.from_waypoints(servo, {1: ([0.0, 1.0], [0.0, 0.5])}, frame_rate=100.0)
+    assert quintic.counts[5, 1] - quintic.counts[0, 1] < cubic.counts[5, 1] - cubic.counts[0, 1]
+
+    loop = Trajectory.from_waypoints(servo, {1: ([0.0, 0.5, 1.0], [0.0, 0.5, 0.0])},
+                                     frame_rate=100.0, periodic=True)
+    assert loop.num_frames == 100
+
+
+def test_unknown_kind(servo):
+    with pytest.raises(ValueError):
+        Trajectory.from_waypoints(servo, {0: ([0.0, 1.0], [0.0, 0.5])}, kind='septic')
+
+
+def test_play_writes_every_frame(servo):
+    trajectory = Trajectory.from_waypoints(servo, {0: ([0.0, 0.05], [0.0, 0.3])}, frame_rate=400.0)
+    frames = []
+    write = servo.pca.goto_16_counts
+
+    def spy(counts, channels=None):
+        frames.append(np.array(counts))
+        write(counts, channels)
+
+    servo.pca.goto_16_counts = spy
+    trajectory.play(servo.pca, loops=2)
+
+    assert len(frames) == 2 * trajectory.num_frames
+    assert servo.pca.bus.led(ADDRESS, 0)[1] == trajectory.counts[-1, 0]
+
+
+def test_play_after_full_off_holds_other_channels(servo):
+    servo.move_16_radian(np.zeros(16))
+    servo.pca.all_full_off()
+
+    trajectory = Trajectory.from_waypoints(servo, {0: ([0.0, 0.05], [0.0, 0.2])})
+    trajectory.play(servo)
+
+    assert servo.pca.bus.led(ADDRESS, 0)[1] == trajectory.counts[-1, 0]
+    assert servo.pca.bus.led(ADDRESS, 1) == (0, 0x1000)
+
+
+def test_save(servo, tmp_path):
+    trajectory = Trajectory.from_waypoints(servo, {0: ([0.0, 0.05], [0.0, 0.3])}, frame_rate=400.0)
+    path = str(tmp_path / 'motion.npy')
+    trajectory.save(path)
+
+    assert np.load(path).tolist() == trajectory.counts.tolist()
+
+
+def test_radian_clip_is_converted(servo, tmp_path):
+    path = str(tmp_path / 'clip.npy')
+    radians = np.zeros((3, 16))
+    radians[:, 0] = [0.1, 0.2, 5.0]
+    np.save(path, radians)
+    clip = Clip(path, 400.0, servo)
+    assert not clip.in_counts
+    clip.play()
+
+    assert servo.pca.last_off[0] == servo.radians_to_counts(radians[-1])[0]
+
+
+def test_count_clip_plays_on_a_pca(servo, tmp_path):
+    path = str(tmp_path / 'clip.npy')
+    np.save(path, np.arange(4 * 16, dtype=np.int16).reshape(4, 16) + 300)
+    clip = Clip(path, 400.0)
+    clip.play(servo.pca, start=1, stop=3)
+
+    assert servo.pca.last_off.tolist() == (np.arange(16) + 32 + 300).tolist()
+
+
+def test_clip_needs_somewhere_to_play(tmp_path):
+    path = str(tmp_path / 'clip.npy')
+    np.save(path, np.full((2, 16), 400, dtype=np.int16))
+    clip = Clip(path, 400.0)
+
+    with pytest.raises(ValueError):
+        clip.play()
+
+    np.save(path, np.zeros((2, 16)))
+    with pytest.raises(ValueError):
+        Clip(path, 400.0)
+
+
+@pytest.mark.parametrize('mode', [{'threaded': True}, {'upsample': 'linear'}])
+def test_count_clip_goes_through_the_output_thread(cal_file, tmp_path, mode):
+    servo = Servo(transport=SimulatedTransport(), cal_file=cal_file, **mode)
+    writers = set()
+    write = servo.pca.goto_16_counts
+
+    def spy(*args):
+        writers.add(threading.current_thread().name)
+        return write(*args)
+
+    servo.pca.goto_16_counts = spy
+    path = str(tmp_path / 'clip.npy')
+    np.save(path, np.full((5, 16), 400, dtype=np.int16))
+    try:
+        Clip(path, 200.0, servo).play()
+        time.sleep(3 * servo.output.period)
+    finally:
+        servo.close()
+
+    assert writers == {'pca9685-output'}
+    assert servo.pca.last_off.tolist() == [400] * 16
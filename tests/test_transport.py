@@ -0,0 +1,75 @@
+import errno
+
+import pytest
+
+from pca9685_psd import PCA9685, SimulatedTransport
+
+ADDRESS = 0x40
+MODE1 = 0x00
+PRESCALE = 0xFE
+SLEEP = 0x10
+AUTO_INCREMENT = 0x20
+ALLLED_ON_L = 0xFA
+
+
+def test_power_on_state():
+    bus = SimulatedTransport([ADDRESS])
+
+    assert bus.sleeping(ADDRESS)
+    assert bus.prescale(ADDRESS) == 0x1E
+    assert bus.led(ADDRESS, 0) == (0, 0x1000)
+
+
+def test_prescale_only_written_while_asleep():
+    bus = SimulatedTransport()
+    bus.write_byte_data(ADDRESS, MODE1, 0x00)
+    bus.write_byte_data(ADDRESS, PRESCALE, 100)
+    assert bus.prescale(ADDRESS) == 0x1E
+
+    bus.write_byte_data(ADDRESS, MODE1, SLEEP)
+    bus.write_byte_data(ADDRESS, PRESCALE, 1)
+    assert bus.prescale(ADDRESS) == 3
+
+
+def test_block_write_needs_auto_increment():
+    bus = SimulatedTransport()
+    bus.write_byte_data(ADDRESS, MODE1, 0x00)
+    bus.write_i2c_block_data(ADDRESS, 0x08, [0x34, 0x02])
+    assert bus.registers(ADDRESS)[0x08] == 0x02        # both bytes went to OFF_L
+
+    bus.write_byte_data(ADDRESS, MODE1, AUTO_INCREMENT)
+    bus.write_i2c_block_data(ADDRESS, 0x08, [0x34, 0x02])
+    assert bus.led(ADDRESS, 0) == (0, 0x234)
+
+    with pytest.raises(ValueError):
+        bus.write_i2c_block_data(ADDRESS, 0x06, [0] * 33)
+
+
+def test_all_led_broadcast():
+    bus = SimulatedTransport()
+    bus.write_byte_data(ADDRESS, MODE1, AUTO_INCREMENT)
+    bus.write_i2c_block_data(ADDRESS, ALLLED_ON_L, [0, 0, 0x2C, 0x01])
+
+    assert [bus.led(ADDRESS, chan) for chan in range(16)] == [(0, 300)] * 16
+    assert bus.read_i2c_block_data(ADDRESS, ALLLED_ON_L, 4) == [0, 0, 0, 0]
+
+
+def test_counters_and_faults():
+    bus = SimulatedTransport()
+    bus.write_byte_data(ADDRESS, MODE1, AUTO_INCREMENT)
+    bus.write_i2c_block_data(ADDRESS, 0x06, [0, 0, 0, 1])
+    assert (bus.transactions, bus.bytes_written) == (2, 7)
+
+    bus.inject_faults(1.0, err=errno.EIO, seed=0)
+    with pytest.raises(OSError) as raised:
+        bus.write_byte_data(ADDRESS, 0x06, 1)
+    assert raised.value.errno == errno.EIO
+    assert bus.registers(ADDRESS)[0x06] == 0
+
+
+def test_pca9685_initializes_the_simulated_chip():
+    bus = SimulatedTransport()
+    pca = PCA9685(transport=bus, address=ADDRESS, bus_frequency=60.0)
+
+    assert not bus.sleeping(ADDRESS)
+    assert bus.prescale(ADDRESS) == pca.prescale(60.0)
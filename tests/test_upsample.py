@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+import pytest
+
+from pca9685_psd import Servo, SimulatedTransport, Upsampler
+
+ADDRESS = 0x40
+
+
+def test_linear_interpolates_between_setpoints():
+    upsampler = Upsampler(Upsampler.LINEAR)
+    assert upsampler.frame(0.0) is None
+
+    upsampler.set_frame(np.full(16, 100), timestamp=0.0)
+    frame, channels = upsampler.frame(0.0)
+    assert frame.tolist() == [100] * 16
+    assert channels.all()
+
+    # The move to a setpoint takes the time between the last two setpoints
+    upsampler.set_frame(np.full(16, 200), timestamp=1.0)
+    assert upsampler.frame(1.5)[0].tolist() == [150] * 16
+    assert upsampler.frame(2.0)[0].tolist() == [200] * 16
+    assert upsampler.frame(9.0)[0].tolist() == [200] * 16
+
+
+def test_limited_does_not_overshoot():
+    upsampler = Upsampler(Upsampler.LIMITED, max_velocity=100.0, max_acceleration=1000.0)
+    upsampler.set_frame(np.zeros(16), timestamp=0.0)
+    upsampler.frame(0.0)
+    upsampler.set_frame(np.full(16, 50), timestamp=0.0)
+
+    dt = 0.01
+    positions = [upsampler.frame(step * dt)[0][0] for step in range(1, 101)]
+    steps = np.diff([0] + positions)
+    assert steps.max() <= 100.0 * dt + 1
+    assert max(positions) == 50
+    assert positions[-1] == 50
+    assert np.all(steps >= 0)
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        Upsampler('cubic')
+
+
+def test_channels_with_no_setpoint_hold_their_initial_counts():
+    known = np.arange(16) < 8
+    upsampler = Upsampler(initial=np.full(16, 367), known=known)
+    upsampler.set_channel(12, 400, timestamp=0.0)
+
+    frame, channels = upsampler.frame(0.0)
+    assert frame[:12].tolist() == [367] * 12
+    assert frame[12] == 400
+    assert channels.tolist() == (known | (np.arange(16) == 12)).tolist()
+
+    upsampler = Upsampler()
+    upsampler.set_channel(2, 400, timestamp=0.0)
+    assert np.flatnonzero(upsampler.frame(0.0)[1]).tolist() == [2]
+
+
+def test_attached_servo_holds_the_other_channels(cal_file):
+    bus = SimulatedTransport()
+    Servo(transport=bus, cal_file=cal_file).pca.goto_16_counts(np.full(16, 367))
+
+    servo = Servo(transport=bus, cal_file=cal_file, upsample='linear', attach=True)
+    assert servo.pca.attached
+    try:
+        servo.move_radian(0, 0.3)
+        time.sleep(3 * servo.output.period)
+    finally:
+        servo.close()
+
+    assert bus.led(ADDRESS, 0)[1] == servo.calibration.radian_to_count(0, 0.3)
+    assert [bus.led(ADDRESS, chan) for chan in range(1, 16)] == [(0, 367)] * 15